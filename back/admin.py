@@ -13,7 +13,9 @@ from .models import (
     HasImage,
     Resolve,
     Clan,
-    MemberRiddleStats
+    MemberRiddleStats,
+    OutboundEmail,
+    Notification
 )
 
 admin.site.site_header = "Administration de Kameleon"
@@ -235,9 +237,10 @@ class ClanAdmin(admin.ModelAdmin):
         'clan_members_count',
         'clan_members_max_count',
         'clan_elo',
+        'clan_score_sum',
         'created_at',
     )
-    readonly_fields = ('created_at', 'clan_members_count', 'clan_elo')
+    readonly_fields = ('created_at', 'clan_members_count', 'clan_elo', 'clan_score_sum')
 
 @admin.register(Clue)
 class ClueAdmin(admin.ModelAdmin):
@@ -291,3 +294,18 @@ class HasImageAdmin(admin.ModelAdmin):
     search_fields = ('riddle__riddle_type', 'image__image_path')
     list_filter = ('riddle__riddle_type',)
     ordering = ('riddle',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    search_fields = ('subject', 'recipients')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipient', 'kind', 'created_at', 'read_at')
+    search_fields = ('recipient__user__username', 'message')
+    list_filter = ('kind',)
+    ordering = ('-created_at',)
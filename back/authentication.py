@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+AUTH_USER_TIMEOUT = 60
+
+# Colonnes d'état volumineuses du membre : rechargées à la demande plutôt que mises en cache,
+# pour qu'une écriture (ex: BitsetRelation) ne parte jamais d'un bitmap périmé.
+DEFERRED_MEMBER_FIELDS = (
+    'member__achieved_riddles_bits',
+    'member__locked_riddles_bits',
+    'member__achieved_coop_riddles_bits',
+    'member__locked_coop_riddles_bits',
+    'member__revealed_clues_bits',
+    'member__theme_histogram',
+)
+
+
+def _version_key(user_id):
+    return f"auth:user:{user_id}:version"
+
+
+def cached_user_key(user_id):
+    version = cache.get_or_set(_version_key(user_id), 1, None)
+    return f"auth:user:{user_id}:v{version}"
+
+
+def invalidate_cached_user(user_id):
+    """À appeler quand le profil, le score, le rang ou le clan d'un utilisateur change."""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        pass  # Pas de version : rien n'est en cache pour cet utilisateur
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication dont l'utilisateur est chargé avec son membre, son rang et son clan
+    en une seule requête (select_related), puis gardé en cache AUTH_USER_TIMEOUT secondes.
+    La clé contient une version par utilisateur, incrémentée par invalidate_cached_user().
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = cached_user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = (
+                self.user_model.objects
+                .select_related('member__rank', 'member__clan')
+                .defer(*DEFERRED_MEMBER_FIELDS)
+                .filter(**{api_settings.USER_ID_FIELD: user_id})
+                .first()
+            )
+            if user is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, user, AUTH_USER_TIMEOUT)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
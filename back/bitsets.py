@@ -0,0 +1,158 @@
+from django.conf import settings
+
+
+class RiddleBitset:
+    """
+    Ensemble d'ids (énigmes ou indices) stocké comme un bitmap dense : le bit n vaut 1 si l'id n est présent.
+    Sérialisé en little-endian dans un BinaryField (bytea) du membre.
+    """
+    __slots__ = ('_bits',)
+
+    def __init__(self, ids=(), bits=0):
+        self._bits = bits
+        for id_ in ids:
+            self._bits |= 1 << id_
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(bits=int.from_bytes(bytes(data or b''), 'little'))
+
+    def to_bytes(self):
+        return self._bits.to_bytes((self._bits.bit_length() + 7) // 8, 'little')
+
+    def __contains__(self, id_):
+        return id_ >= 0 and bool(self._bits >> id_ & 1)
+
+    def __iter__(self):
+        bits = self._bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __len__(self):
+        return self._bits.bit_count()
+
+    def __bool__(self):
+        return self._bits != 0
+
+    def __eq__(self, other):
+        return isinstance(other, RiddleBitset) and self._bits == other._bits
+
+    def __hash__(self):
+        return hash(self._bits)
+
+    def __repr__(self):
+        return f"RiddleBitset({self.ids()})"
+
+    def __or__(self, other):
+        return RiddleBitset(bits=self._bits | other._bits)
+
+    def __and__(self, other):
+        return RiddleBitset(bits=self._bits & other._bits)
+
+    def __sub__(self, other):
+        return RiddleBitset(bits=self._bits & ~other._bits)
+
+    def __xor__(self, other):
+        return RiddleBitset(bits=self._bits ^ other._bits)
+
+    def issubset(self, other):
+        return self._bits & ~other._bits == 0
+
+    def add(self, id_):
+        self._bits |= 1 << id_
+
+    def discard(self, id_):
+        self._bits &= ~(1 << id_)
+
+    def ids(self):
+        return list(self)
+
+
+def bitset_storage_enabled():
+    """True si l'état des membres est stocké en bitmaps (MEMBER_STATE_STORAGE = 'bitset')."""
+    return settings.MEMBER_STATE_STORAGE == 'bitset'
+
+
+def bits_field_name(relation):
+    return f"{relation}_bits"
+
+
+class BitsetRelation:
+    """
+    Couche de compatibilité : expose le bitmap d'un membre avec l'API d'un related manager M2M
+    (all, filter, values_list, count, exists, add, remove, set, clear).
+    Les écritures mettent à jour uniquement la colonne bitmap du membre.
+    """
+
+    def __init__(self, member, relation):
+        self.member = member
+        self.relation = relation
+        self.field_name = bits_field_name(relation)
+        self.model = type(member)._meta.get_field(relation).related_model
+
+    @property
+    def bits(self):
+        return RiddleBitset.from_bytes(getattr(self.member, self.field_name))
+
+    def _save(self, bits):
+        data = bits.to_bytes()
+        setattr(self.member, self.field_name, data)
+        type(self.member).objects.filter(pk=self.member.pk).update(**{self.field_name: data})
+
+    @staticmethod
+    def _ids(objs):
+        return [obj if isinstance(obj, int) else obj.pk for obj in objs]
+
+    def all(self):
+        return self.model.objects.filter(pk__in=self.bits.ids())
+
+    def filter(self, *args, **kwargs):
+        return self.all().filter(*args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self.all().exclude(*args, **kwargs)
+
+    def values_list(self, *fields, **kwargs):
+        return self.all().values_list(*fields, **kwargs)
+
+    def count(self):
+        return len(self.bits)
+
+    def exists(self):
+        return bool(self.bits)
+
+    def add(self, *objs):
+        self._save(self.bits | RiddleBitset(self._ids(objs)))
+
+    def remove(self, *objs):
+        self._save(self.bits - RiddleBitset(self._ids(objs)))
+
+    def set(self, objs):
+        self._save(RiddleBitset(self._ids(objs)))
+
+    def clear(self):
+        self._save(RiddleBitset())
+
+
+class MemberStateDescriptor:
+    """
+    Remplace le descripteur M2M d'une relation d'état du membre : renvoie le related manager
+    habituel en mode 'm2m' et un BitsetRelation en mode 'bitset'. Au niveau de la classe
+    (Member.achieved_riddles.through...), le descripteur M2M d'origine est renvoyé.
+    """
+
+    def __init__(self, m2m_descriptor, relation):
+        self.m2m_descriptor = m2m_descriptor
+        self.relation = relation
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.m2m_descriptor
+        if bitset_storage_enabled():
+            return BitsetRelation(instance, self.relation)
+        return self.m2m_descriptor.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        self.m2m_descriptor.__set__(instance, value)
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from .models import Riddle
+from .serializers import RiddleSerializer, RiddleSummarySerializer
+
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+CATALOGUE_TIMEOUT = 24 * 60 * 60
+
+
+def catalogue_version():
+    """Version courante du catalogue d'énigmes, partagée par tous les workers via le cache."""
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def bump_catalogue_version():
+    """Invalide toutes les réponses du catalogue en cache (appelé par les signaux de Riddle, Clue et des dépendances)."""
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 2, None)
+
+
+def catalogue_etag(version, name):
+    return f'"catalogue-{version}-{name}"'
+
+
+def get_payload(version, name, build):
+    """
+    Renvoie le JSON (bytes) pré-sérialisé de `name` pour cette version du catalogue,
+    en le construisant avec `build()` au premier accès. Renvoie None si `build()` renvoie None.
+    """
+    key = f"catalogue:v{version}:{name}"
+    payload = cache.get(key)
+    if payload is None:
+        data = build()
+        if data is None:
+            return None
+        payload = JSONRenderer().render(data)
+        cache.set(key, payload, CATALOGUE_TIMEOUT)
+    return payload
+
+
+def build_riddle_list(mode):
+    riddles = (
+        Riddle.objects.filter(riddle_mode=mode)
+        .only('riddle_id', 'riddle_type', 'riddle_theme', 'riddle_difficulty', 'riddle_points', 'riddle_path')
+        .prefetch_related(Prefetch('riddle_dependance', queryset=Riddle.objects.only('riddle_id')))
+    )
+    return RiddleSummarySerializer(riddles, many=True).data
+
+
+def build_riddle_detail(riddle_id):
+    riddle = (
+        Riddle.objects.filter(riddle_id=riddle_id)
+        .defer('riddle_response')
+        .prefetch_related(
+            'clue_set',
+            Prefetch('riddle_dependance', queryset=Riddle.objects.only('riddle_id', 'riddle_theme', 'riddle_points')),
+        )
+        .first()
+    )
+    if riddle is None:
+        return None
+    return RiddleSerializer(riddle).data
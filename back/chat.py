@@ -0,0 +1,78 @@
+import json
+import time
+from collections import deque
+from threading import Lock
+from django.conf import settings
+
+
+class InMemoryChatHistory:
+    """Historique borné par salle, local au processus (tests, développement)."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = Lock()
+        self._rooms = {}
+
+    def append(self, room, message):
+        with self._lock:
+            self._rooms.setdefault(room, deque(maxlen=self.size)).append(message)
+
+    def recent(self, room):
+        with self._lock:
+            return list(self._rooms.get(room, ()))
+
+
+class RedisChatHistory:
+    """Historique borné par salle : une liste Redis `<prefix>:<room>` tronquée à `size` éléments (RPUSH + LTRIM)."""
+
+    def __init__(self, url, prefix, size):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self.size = size
+
+    def append(self, room, message):
+        key = f"{self._prefix}:{room}"
+        pipe = self._client.pipeline()
+        pipe.rpush(key, json.dumps(message))
+        pipe.ltrim(key, -self.size, -1)
+        pipe.execute()
+
+    def recent(self, room):
+        return [json.loads(value) for value in self._client.lrange(f"{self._prefix}:{room}", 0, -1)]
+
+
+class RateLimiter:
+    """Seau à jetons d'une connexion : `capacity` messages d'affilée, rechargé de `refill_rate` messages par seconde."""
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_rate)
+        self._updated_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+_chat_history = None
+_chat_history_lock = Lock()
+
+
+def chat_history():
+    global _chat_history
+    if _chat_history is None:
+        with _chat_history_lock:
+            if _chat_history is None:
+                config = settings.CHAT
+                if config['BACKEND'] == 'redis':
+                    _chat_history = RedisChatHistory(config['URL'], config['KEY_PREFIX'], config['HISTORY_SIZE'])
+                else:
+                    _chat_history = InMemoryChatHistory(config['HISTORY_SIZE'])
+    return _chat_history
@@ -0,0 +1,199 @@
+import hashlib
+import hmac
+import json
+import logging
+import random
+from threading import Lock
+from typing import NamedTuple
+from .authentication import invalidate_cached_user
+from .catalogue import catalogue_version
+from .models import Member, Riddle
+
+logger = logging.getLogger('custom_logger')
+
+
+def canonical_json(value):
+    """Forme canonique d'une réponse JSON : clés triées, flottants entiers ramenés à des entiers."""
+    def normalise(item):
+        if isinstance(item, dict):
+            return {str(key): normalise(val) for key, val in item.items()}
+        if isinstance(item, (list, tuple)):
+            return [normalise(val) for val in item]
+        if isinstance(item, float) and item.is_integer():
+            return int(item)
+        return item
+    return json.dumps(normalise(value), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class AnswerEntry(NamedTuple):
+    """Données d'une énigme nécessaires à la vérification et à la résolution (sans la réponse en clair)."""
+    riddle_id: int
+    riddle_type: str
+    riddle_mode: str
+    riddle_theme: str
+    riddle_points: int
+    answer_digest: bytes
+
+    def as_riddle(self):
+        """Instance Riddle non rechargée, suffisante pour le moteur de résolution."""
+        return Riddle(
+            riddle_id=self.riddle_id,
+            riddle_type=self.riddle_type,
+            riddle_mode=self.riddle_mode,
+            riddle_theme=self.riddle_theme,
+            riddle_points=self.riddle_points,
+        )
+
+
+############################################################################################################################
+# region Checkers
+
+_checkers_by_id = {}
+_checkers_by_type = {}
+_checkers_by_mode = {}
+
+
+def register_checker(riddle_type=None, riddle_id=None, riddle_mode=None):
+    """
+    Enregistre une classe de vérification pour un type d'énigme (`riddle_type`),
+    une énigme précise (`riddle_id`) ou, par défaut, un mode ('solo' / 'coop').
+    """
+    def decorator(checker_class):
+        checker = checker_class()
+        if riddle_id is not None:
+            _checkers_by_id[riddle_id] = checker
+        if riddle_type is not None:
+            _checkers_by_type[riddle_type] = checker
+        if riddle_mode is not None:
+            _checkers_by_mode[riddle_mode] = checker
+        return checker_class
+    return decorator
+
+
+def get_checker(riddle_id, riddle_type, riddle_mode):
+    return (
+        _checkers_by_id.get(riddle_id)
+        or _checkers_by_type.get(riddle_type)
+        or _checkers_by_mode.get(riddle_mode)
+        or _checkers_by_mode['solo']
+    )
+
+
+@register_checker(riddle_mode='solo')
+class AnswerChecker:
+    """Compare l'empreinte de la réponse normalisée à celle de la réponse attendue, en temps constant."""
+
+    def normalise(self, response):
+        return response
+
+    def digest(self, response):
+        return hashlib.sha256(canonical_json(self.normalise(response)).encode()).digest()
+
+    def check(self, entry, member, response):
+        try:
+            return hmac.compare_digest(self.digest(response), entry.answer_digest)
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+    def on_solved(self, entry, member):
+        """Effets de bord après une résolution réussie."""
+
+    def on_already_solved(self, entry, member):
+        """Effets de bord quand l'énigme était déjà résolue."""
+
+
+@register_checker(riddle_mode='coop')
+class CoopValueChecker(AnswerChecker):
+    """Les réponses coop sont comparées sur leur sous-objet 'value'."""
+
+    def normalise(self, response):
+        return response.get('value', {})
+
+
+@register_checker(riddle_id=8)
+class RandomNumberChecker(AnswerChecker):
+    """Énigme 8 : la réponse doit contenir un nombre tiré au hasard entre 0 et 9999."""
+
+    def check(self, entry, member, response):
+        if not isinstance(response, dict) or not isinstance(response.get('value'), dict):
+            return False
+        random_number_str = str(random.randint(0, 9999))
+        logger.debug(f"Generated random number: {random_number_str}")
+        return random_number_str in response['value'].values()
+
+
+@register_checker(riddle_id=9)
+class CalculatriceChecker(AnswerChecker):
+    """Énigme 9 : débloque la calculatrice du membre."""
+
+    def on_solved(self, entry, member):
+        Member.objects.filter(pk=member.pk).update(have_calculatrice=True)
+        invalidate_cached_user(member.pk)
+
+    on_already_solved = on_solved
+
+# endregion
+############################################################################################################################
+# region Answer index
+
+
+class AnswerIndex:
+    """
+    Empreintes des réponses attendues, calculées une fois par version du catalogue et gardées en mémoire.
+    La vérification d'une réponse ne relit donc jamais la ligne Riddle.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = {}
+
+    def _build(self):
+        entries = {}
+        riddles = Riddle.objects.values_list(
+            'riddle_id', 'riddle_type', 'riddle_mode', 'riddle_theme', 'riddle_points', 'riddle_response'
+        )
+        for riddle_id, riddle_type, riddle_mode, riddle_theme, riddle_points, riddle_response in riddles:
+            checker = get_checker(riddle_id, riddle_type, riddle_mode)
+            try:
+                answer_digest = checker.digest(riddle_response)
+            except (TypeError, ValueError, AttributeError):
+                logger.warning(f"Réponse attendue invalide pour l'énigme {riddle_id}")
+                answer_digest = b''
+            entries[riddle_id] = AnswerEntry(riddle_id, riddle_type, riddle_mode, riddle_theme, riddle_points, answer_digest)
+        return entries
+
+    def get(self, riddle_id):
+        try:
+            riddle_id = int(riddle_id)
+        except (TypeError, ValueError):
+            return None
+
+        version = catalogue_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries = self._build()
+                    self._version = version
+        return self._entries.get(riddle_id)
+
+    def riddle_ids(self):
+        self.get(0)  # Met l'index à jour si besoin
+        return self._entries.keys()
+
+
+answer_index = AnswerIndex()
+
+
+def verify_answer(member, riddle_id, response):
+    """
+    Vérifie une réponse. Retourne (entry, checker, is_correct), ou (None, None, False)
+    si l'énigme n'existe pas.
+    """
+    entry = answer_index.get(riddle_id)
+    if entry is None:
+        return None, None, False
+    checker = get_checker(entry.riddle_id, entry.riddle_type, entry.riddle_mode)
+    return entry, checker, checker.check(entry, member, response)
+
+# endregion
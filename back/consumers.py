@@ -1,60 +1,159 @@
+import asyncio
 import json
+import time
+from django.conf import settings
+from django.db.models import Q
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from .models import CoopInvitation, Member
+from .presence import coop_presence
+from .chat import chat_history, RateLimiter
+from .notifications import mark_read, unread_notifications, user_group
+from .coop_game import coop_game, CoopGameError, SOLVED
+from .checkers import answer_index, get_checker, verify_answer
+from .solving import solve_coop_riddle
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Salons de discussion : global (ws/chat/), clan du membre (ws/chat/clan/)
+    et salle coop d'une énigme (ws/chat/coop/<riddle_id>/).
+    L'auteur d'un message est l'utilisateur authentifié (scope["user"]), jamais le client.
+    À la connexion, les derniers messages du salon sont renvoyés (historique borné, back/chat.py).
+    Les salons passent par la couche "chat", répartie sur plusieurs Redis (CHANNEL_LAYERS).
+    """
+    channel_layer_alias = "chat"
+
+    def __init__(self, *args, room_kind="global", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.room_kind = room_kind
+
     async def connect(self):
-        self.room_group_name = "chat_room"
+        self.room_group_name = await self.get_room()
+        if self.room_group_name is None:
+            await self.close()
+            return
+
+        self.rate_limiter = RateLimiter(*settings.CHAT['RATE'])
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         await self.accept()
 
+        history = await sync_to_async(chat_history().recent, thread_sensitive=False)(self.room_group_name)
+        await self.send(text_data=json.dumps({
+            'type': 'history',
+            'messages': history,
+        }))
+
+    @database_sync_to_async
+    def get_room(self):
+        """Nom du groupe du salon, ou None si l'utilisateur n'y a pas accès."""
+        user = self.scope["user"]
+        if self.room_kind == "global":
+            return "chat_room"
+        if user.is_anonymous:
+            return None
+        if self.room_kind == "clan":
+            clan_id = Member.objects.filter(pk=user.pk).values_list('clan_id', flat=True).first()
+            return f"chat_clan_{clan_id}" if clan_id else None
+        if self.room_kind == "coop":
+            riddle_id = self.scope['url_route']['kwargs']['riddle_id']
+            is_player = CoopInvitation.objects.filter(
+                Q(inviter_id=user.pk) | Q(invitee_id=user.pk),
+                riddle_id=riddle_id,
+                status='accepted',
+            ).exists()
+            return f"chat_coop_{riddle_id}" if is_player else None
+        return None
+
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if getattr(self, 'room_group_name', None):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
+        user = self.scope["user"]
+        if user.is_anonymous:
+            await self.send_error("Connectez-vous pour écrire dans le salon.")
+            return
+        if not self.rate_limiter.allow():
+            await self.send_error("Vous envoyez trop de messages, patientez un instant.")
+            return
+
         data = json.loads(text_data)
-        username = data.get('username', 'Anonyme')
-        message = data.get('message', '')
+        message = str(data.get('message', '')).strip()[:settings.CHAT['MAX_LENGTH']]
+        if not message:
+            return
+
+        chat_message = {
+            'username': user.username,
+            'body': message,
+            'sent_at': time.time(),
+        }
+        await sync_to_async(chat_history().append, thread_sensitive=False)(self.room_group_name, chat_message)
 
         # On envoie username et message dans le group_send
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'username': username,
-                'message': message,
+                **chat_message,
             }
         )
 
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message,
+        }))
+
     async def chat_message(self, event):
-        # event contient 'username' et 'message'
+        # event contient 'username', 'body' et 'sent_at'
         await self.send(text_data=json.dumps({
             'username': event['username'],
-            'body': event['message']
+            'body': event['body'],
+            'sent_at': event['sent_at'],
         }))
 
 
 class CoopConsumer(AsyncWebsocketConsumer):
-    
+    """
+    Salle coop d'une énigme, réservée aux joueurs : celui qui a invité (le chef)
+    et les invités ayant accepté. Les membres connectés sont suivis dans le registre de présence
+    (back/presence.py) : la liste est calculée une fois par l'émetteur et incluse dans
+    les évènements member_joined / member_left, sans requête à la réception.
+    """
+
     @database_sync_to_async
-    def get_member(self, username):
-        return Member.objects.get(user__username=username)
-    
+    def get_player(self, user):
+        """(membre, rôle) si l'utilisateur joue cette coop, None sinon."""
+        inviter_ids = list(
+            CoopInvitation.objects.filter(riddle_id=self.riddle_id)
+            .filter(Q(inviter_id=user.pk, status__in=['pending', 'accepted']) | Q(invitee_id=user.pk, status='accepted'))
+            .values_list('inviter_id', flat=True)
+        )
+        if not inviter_ids:
+            return None
+        # Le chef est celui qui a lancé les invitations ; il attend ses coéquipiers dans la salle
+        role = "Chef" if user.pk in inviter_ids else "Membre"
+        return Member.objects.get(pk=user.pk), role
+
     async def connect(self):
         user = self.scope["user"]
-        print(user.username)
+        self.group_name = None
         if user.is_anonymous:
             await self.close()
         else:
-            self.member = await self.get_member(user.username)
             self.riddle_id = self.scope['url_route']['kwargs']['riddle_id']
+            player = await self.get_player(user)
+            if player is None:
+                await self.close()
+                return
+            self.member, self.role = player
             self.group_name = f"coop_{self.riddle_id}"
 
             # Joindre le groupe
@@ -65,70 +164,122 @@ class CoopConsumer(AsyncWebsocketConsumer):
 
             await self.accept()
 
-            # ---- Déterminer si l'utilisateur est déjà "accepted" dans la coop
-            # (Optionnel, dépend de la logique métier) : 
-            # par exemple, on peut vérifier si l'invitation est acceptée, etc.
-            # S’il n’est pas "accepted", on peut décider de le déconnecter.
-
-            # Récupérer tous les membres existants en base
-            members_usernames = await self.get_coop_members()
+            # Enregistrer la présence avec le rôle (chef ou membre) et récupérer la liste des connectés
+            members = await sync_to_async(coop_presence().join, thread_sensitive=False)(
+                self.group_name, self.channel_name, user.username, self.role
+            )
+            game_state = await sync_to_async(coop_game().snapshot, thread_sensitive=False)(self.group_name)
 
-            # Notifier que l'utilisateur vient de se connecter
-            # On veut diffuser la liste actualisée à tout le monde
+            # Notifier que l'utilisateur vient de se connecter, avec la liste actualisée
             await self.channel_layer.group_send(
                 self.group_name,
                 {
                     "type": "member_joined",
-                    "username": user.username
+                    "username": user.username,
+                    "members": members,
                 }
             )
 
             # Envoyer la liste des membres connectés uniquement au nouvel arrivant
             # y compris le rôle (chef ou membre)
+            # ainsi que l'état complet de la partie (les mises à jour suivantes sont des deltas)
             await self.send(text_data=json.dumps({
                 'type': 'init',
-                'members': members_usernames
+                'members': members,
+                'game': game_state,
             }))
     
     async def receive(self, text_data):
         """
         Reçoit un message du front. Par exemple:
-          {
-            "action": "start_game"
-          }
+          {"action": "start_game"}
+          {"action": "submit_answer", "response": {"value": {...}}}
+        L'état de la partie (lobby -> running -> solved) est tenu côté serveur (back/coop_game.py) ;
+        chaque transition est diffusée au groupe sous forme de delta.
         """
         data = json.loads(text_data)
         action = data.get("action")
+        username = self.scope['user'].username
 
-        if action == "start_game":
-            # Optionnel : vérifier si l'utilisateur est le chef
-            # - On récupère la liste en BDD
-            # - On compare le username
-            # S'il est "chef", on envoie l'événement start_game
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'start_game',
-                    'message': f"Le jeu est lancé par {self.scope['user'].username} !"
-                }
-            )
+        try:
+            if action == "start_game":
+                # Seul le chef peut lancer la partie ; une partie résolue peut être rejouée
+                delta = await sync_to_async(coop_game().start, thread_sensitive=False)(
+                    self.group_name, username, self.role
+                )
+                await self.channel_layer.group_send(
+                    self.group_name,
+                    {
+                        'type': 'start_game',
+                        'message': f"Le jeu est lancé par {username} !",
+                        'delta': delta,
+                    }
+                )
+
+            elif action == "submit_answer":
+                is_correct = await self.check_answer(data.get("response"))
+                delta = await sync_to_async(coop_game().record_attempt, thread_sensitive=False)(
+                    self.group_name, username, is_correct
+                )
+                if delta.get('phase') == SOLVED:
+                    # L'énigme est validée pour les joueurs présents dans la salle
+                    members = await sync_to_async(coop_presence().roster, thread_sensitive=False)(self.group_name)
+                    await self.solve_for_members([member['username'] for member in members])
+                await self.channel_layer.group_send(
+                    self.group_name,
+                    {'type': 'game_state', 'delta': delta}
+                )
+        except CoopGameError as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': str(e),
+            }))
+
+    @database_sync_to_async
+    def check_answer(self, response):
+        """Vérification côté serveur, via le registre de vérificateurs (back/checkers.py)."""
+        entry, checker, is_correct = verify_answer(self.member, self.riddle_id, response)
+        if entry is None or entry.riddle_mode != 'coop':
+            raise CoopGameError("Énigme coop introuvable.")
+        return is_correct
+
+    @database_sync_to_async
+    def solve_for_members(self, usernames):
+        entry = answer_index.get(self.riddle_id)
+        checker = get_checker(entry.riddle_id, entry.riddle_type, entry.riddle_mode)
+        # Seuls les joueurs de la coop (chef et invités ayant accepté) sont crédités
+        player_ids = {
+            pk
+            for pair in CoopInvitation.objects.filter(riddle_id=self.riddle_id, status='accepted')
+            .values_list('inviter_id', 'invitee_id')
+            for pk in pair
+        }
+        members = Member.objects.filter(pk__in=player_ids, user__username__in=usernames).only('user_id', 'member_clan_score')
+        for member in members:
+            if solve_coop_riddle(member, entry.as_riddle()):
+                checker.on_solved(entry, member)
 
     async def disconnect(self, close_code):
         user = self.scope['user']
-        if not user.is_anonymous:
-            # Notifier le groupe qu'un membre a quitté
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'member_left',
-                    'username': user.username
-                }
+        if self.group_name:
+            entry, members = await sync_to_async(coop_presence().leave, thread_sensitive=False)(
+                self.group_name, self.channel_name
             )
+            # Notifier le groupe qu'un membre a quitté (seulement s'il n'a plus aucune connexion)
+            if entry and all(member['username'] != user.username for member in members):
+                await self.channel_layer.group_send(
+                    self.group_name,
+                    {
+                        'type': 'member_left',
+                        'username': user.username,
+                        'members': members,
+                    }
+                )
 
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
     # Réception d'un message "coop_message" depuis le groupe
     async def coop_message(self, event):
@@ -146,75 +297,106 @@ class CoopConsumer(AsyncWebsocketConsumer):
         message = event['message']
         await self.send(text_data=json.dumps({
             'type': 'start_game',
-            'message': message
+            'message': message,
+            'game': event['delta'],
         }))
 
-    # Méthode pour obtenir les membres coopératifs validés en BDD
-    @database_sync_to_async
-    def get_coop_members(self):
-        invitations = CoopInvitation.objects.filter(
-            riddle__riddle_id=self.riddle_id,
-            status='accepted'
-        )
-        # On peut renvoyer une liste de dicos {username, role}
-        # Par exemple, le premier "accepted" est "chef", le reste "membre"
-        # => C’est une décision métier ; on peut stocker la notion de "chef"
-        #    autrement si souhaité.
-        members = []
-        accepted_users = [inv.invitee.user for inv in invitations]
-        for idx, user in enumerate(accepted_users):
-            role = "Chef" if idx == 0 else "Membre"
-            members.append({"username": user.username, "role": role})
-        return members
+    async def game_state(self, event):
+        """Delta de l'état de la partie : uniquement les champs modifiés et la nouvelle version."""
+        await self.send(text_data=json.dumps({
+            'type': 'game_state',
+            'game': event['delta'],
+        }))
 
     # --------- Gestion des événements de groupe -----------
+    # La liste des membres est fournie par l'émetteur : aucune requête ici
     async def member_joined(self, event):
-        username = event['username']
-
-        # Récupère la liste complète des membres en base,
-        # afin d’inclure ce nouveau membre s’il est "accepted".
-        members = await self.get_coop_members()
-
-        # Notifier *tous* les sockets du groupe
         await self.send(text_data=json.dumps({
             'type': 'member_joined',
-            'username': username,
-            'members': members,
+            'username': event['username'],
+            'members': event['members'],
         }))
 
     async def member_left(self, event):
-        username = event['username']
-        # On récupère la liste des membres restants
-        members = await self.get_coop_members()
-
         await self.send(text_data=json.dumps({
             'type': 'member_left',
-            'username': username,
-            'members': members,
+            'username': event['username'],
+            'members': event['members'],
         }))
         
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Notifications d'un utilisateur. À la connexion, les notifications non lues de sa boîte
+    de réception lui sont remises ; ensuite, les notifications reçues en rafale sont
+    regroupées pendant COALESCE_DELAY secondes et envoyées en une seule trame.
+    Le client peut envoyer {"action": "mark_read", "ids": [...]} (ids absent : toutes).
+    """
+    COALESCE_DELAY = 0.25
+
     async def connect(self):
         user = self.scope["user"]
         if user.is_anonymous:
             await self.close()
         else:
-            self.group_name = f"user_{user.id}"
+            self.group_name = user_group(user.id)
+            self._pending = []
+            self._flush_task = None
             await self.channel_layer.group_add(
                 self.group_name,
                 self.channel_name
             )
             await self.accept()
 
+            # Remise des notifications non lues reçues hors ligne
+            unread = await database_sync_to_async(unread_notifications)(user.id)
+            if unread:
+                await self.send_notifications(unread)
+
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        if getattr(self, 'group_name', None):
+            if self._flush_task:
+                self._flush_task.cancel()
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
-    async def send_notification(self, event):
-        message = event['message']
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        if data.get("action") == "mark_read":
+            ids = data.get("ids")
+            await database_sync_to_async(mark_read)(self.scope["user"].id, ids)
+
+    async def send_notifications(self, notifications):
         await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'message': message
-        }))
\ No newline at end of file
+            'type': 'notifications',
+            'notifications': notifications,
+        }))
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.COALESCE_DELAY)
+        pending, self._pending = self._pending, []
+        self._flush_task = None
+        if pending:
+            await self.send_notifications(pending)
+
+    async def queue_notification(self, notification):
+        self._pending.append(notification)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def send_notification(self, event):
+        notification = event.get('notification') or {'kind': 'message', 'message': event['message']}
+        await self.queue_notification(notification)
+
+    async def coop_invitation(self, event):
+        # Ancien format d'évènement (sans passage par la boîte de réception)
+        await self.queue_notification({
+            'kind': 'coop_invitation',
+            'message': event['message'],
+            'data': {
+                'invitation_id': event.get('invitation_id'),
+                'riddle_id': event.get('riddle_id'),
+                'riddle_type': event.get('riddle_type'),
+            },
+        })
@@ -0,0 +1,150 @@
+import json
+import time
+from threading import Lock
+from django.conf import settings
+
+# Une partie sans activité depuis ce délai est oubliée
+GAME_TIMEOUT = 24 * 60 * 60
+
+LOBBY, RUNNING, SOLVED = 'lobby', 'running', 'solved'
+
+
+class CoopGameError(Exception):
+    """Action refusée dans l'état courant de la partie (le message est renvoyé au joueur)."""
+
+
+def initial_state():
+    return {
+        'version': 0,
+        'phase': LOBBY,
+        'started_by': None,
+        'started_at': None,
+        'attempts': 0,
+        'last_attempt_by': None,
+        'solved_by': None,
+        'solved_at': None,
+    }
+
+
+class InMemoryGameStore:
+    """État des parties local au processus (tests, développement)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._states = {}
+
+    def get(self, room):
+        with self._lock:
+            return dict(self._states.get(room) or initial_state())
+
+    def update(self, room, mutate):
+        with self._lock:
+            state = dict(self._states.get(room) or initial_state())
+            changes = mutate(state)
+            state.update(changes)
+            self._states[room] = state
+            return state
+
+
+class RedisGameStore:
+    """
+    État des parties partagé entre les workers : un JSON par salle, `<prefix>:<room>`.
+    Les transitions sont des compare-and-set (WATCH / MULTI), rejouées en cas de conflit.
+    """
+
+    def __init__(self, url, prefix):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, room):
+        return f"{self._prefix}:{room}"
+
+    def get(self, room):
+        value = self._client.get(self._key(room))
+        return json.loads(value) if value else initial_state()
+
+    def update(self, room, mutate):
+        key = self._key(room)
+        result = {}
+
+        def transaction(pipe):
+            value = pipe.get(key)
+            state = json.loads(value) if value else initial_state()
+            changes = mutate(state)
+            state.update(changes)
+            pipe.multi()
+            pipe.set(key, json.dumps(state), ex=GAME_TIMEOUT)
+            result['state'] = state
+
+        self._client.transaction(transaction, key)
+        return result['state']
+
+
+class CoopGameEngine:
+    """
+    Machine à états d'une salle coop : lobby -> running -> solved (-> running pour rejouer).
+    Chaque transition renvoie un delta {version, changes} (seuls les champs modifiés)
+    à diffuser aux joueurs ; un joueur qui arrive reçoit l'état complet via `snapshot`.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def snapshot(self, room):
+        return self.store.get(room)
+
+    def _transition(self, room, mutate):
+        changed = {}
+
+        def apply(state):
+            changes = mutate(state)
+            changes['version'] = state['version'] + 1
+            changed.clear()
+            changed.update(changes)
+            return changes
+
+        self.store.update(room, apply)
+        return changed
+
+    def start(self, room, username, role):
+        def mutate(state):
+            if state['phase'] == RUNNING:
+                raise CoopGameError("La partie a déjà commencé.")
+            if role != "Chef":
+                raise CoopGameError("Seul le chef peut lancer la partie.")
+            # Relancer une partie résolue repart d'un état vierge
+            changes = {key: value for key, value in initial_state().items() if key != 'version'}
+            changes.update(phase=RUNNING, started_by=username, started_at=time.time())
+            return changes
+        return self._transition(room, mutate)
+
+    def record_attempt(self, room, username, is_correct):
+        def mutate(state):
+            if state['phase'] == LOBBY:
+                raise CoopGameError("La partie n'a pas commencé.")
+            if state['phase'] == SOLVED:
+                raise CoopGameError("L'énigme est déjà résolue.")
+            changes = {'attempts': state['attempts'] + 1, 'last_attempt_by': username}
+            if is_correct:
+                changes.update(phase=SOLVED, solved_by=username, solved_at=time.time())
+            return changes
+        return self._transition(room, mutate)
+
+
+_coop_game = None
+_coop_game_lock = Lock()
+
+
+def coop_game():
+    global _coop_game
+    if _coop_game is None:
+        with _coop_game_lock:
+            if _coop_game is None:
+                config = settings.COOP_PRESENCE
+                if config['BACKEND'] == 'redis':
+                    store = RedisGameStore(config['URL'], config['GAME_KEY_PREFIX'])
+                else:
+                    store = InMemoryGameStore()
+                _coop_game = CoopGameEngine(store)
+    return _coop_game
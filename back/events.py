@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import queue
+from threading import Lock, Thread
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger('custom_logger')
+
+
+class BackgroundEventPublisher:
+    """
+    Envoie les évènements temps réel depuis un thread dédié, avec sa propre boucle asyncio :
+    les vues ne font qu'ajouter l'évènement à une file, sans attendre Redis.
+    Les évènements en attente sont envoyés par lots (group_send concurrents).
+    """
+
+    def __init__(self, batch_size, max_queue_size):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = Thread(target=self._run, name='realtime-events', daemon=True)
+                    self._thread.start()
+
+    def enqueue(self, group, event):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((group, event))
+        except queue.Full:
+            logger.warning(f"File des évènements temps réel pleine : évènement {event.get('type')} pour {group} abandonné")
+
+    def flush(self):
+        """Attend que tous les évènements en file aient été envoyés (arrêt du processus, tests)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        from channels.layers import get_channel_layer
+
+        loop = asyncio.new_event_loop()
+        channel_layer = get_channel_layer()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            loop.run_until_complete(self._send(channel_layer, batch))
+
+    async def _send(self, channel_layer, batch):
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in batch),
+            return_exceptions=True,
+        )
+        for (group, event), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Envoi de l'évènement {event.get('type')} au groupe {group} impossible : {result!r}")
+            self._queue.task_done()
+
+
+class LocalEventPublisher:
+    """
+    Publication en mémoire pour les tests : les évènements sont seulement ajoutés à `outbox`
+    (liste de (groupe, évènement)), comme les e-mails avec le backend locmem.
+    """
+
+    def __init__(self):
+        self.outbox = []
+
+    def enqueue(self, group, event):
+        self.outbox.append((group, event))
+
+    def flush(self):
+        pass
+
+
+_publisher = None
+_publisher_lock = Lock()
+
+
+def event_publisher():
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                config = settings.REALTIME_EVENTS
+                if config['BACKEND'] == 'local':
+                    _publisher = LocalEventPublisher()
+                else:
+                    _publisher = BackgroundEventPublisher(config['BATCH_SIZE'], config['MAX_QUEUE_SIZE'])
+    return _publisher
+
+
+def publish(group, event):
+    """
+    Publie un évènement temps réel (`group_send`) après le commit de la transaction en cours
+    (immédiatement hors transaction), sans bloquer la requête.
+    """
+    transaction.on_commit(lambda: event_publisher().enqueue(group, event))
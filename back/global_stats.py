@@ -0,0 +1,134 @@
+import logging
+import time
+from threading import Lock, Thread
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Sum
+from .models import Clan, Member
+from .bitsets import RiddleBitset, bitset_storage_enabled
+
+logger = logging.getLogger('custom_logger')
+
+# Compteurs partagés entre les workers (cache Redis). Les scores sont stockés en centièmes
+# de point pour rester des entiers incrémentables.
+COUNTER_KEYS = {
+    'total_clans': 'global_stats:total_clans',
+    'total_defis_realises': 'global_stats:total_defis_realises',
+    'total_scores': 'global_stats:total_scores_centi',
+}
+SCORE_SCALE = 100
+
+# Instantané local au processus : servi tel quel pendant FRESH_TTL secondes, puis servi
+# périmé (et rafraîchi en arrière-plan) jusqu'à STALE_TTL secondes.
+FRESH_TTL = 10
+STALE_TTL = 5 * 60
+
+
+def _incr(name, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(COUNTER_KEYS[name], delta)
+    except ValueError:
+        pass  # Compteur absent : il sera recalculé à la prochaine lecture
+    except Exception:
+        logger.error("Mise à jour des statistiques globales impossible", exc_info=True)
+
+
+def record_solve(points):
+    """Une énigme solo vient d'être résolue pour `points` points."""
+    _incr('total_defis_realises', 1)
+    _incr('total_scores', round(points * SCORE_SCALE))
+
+
+def record_clans(delta):
+    _incr('total_clans', delta)
+
+
+def record_member_removed(member):
+    _incr('total_defis_realises', -sum((member.theme_histogram or {}).values()))
+    _incr('total_scores', -round(member.member_score * SCORE_SCALE))
+
+
+def reconcile():
+    """Recalcule les valeurs exactes en base et réinitialise les compteurs."""
+    if bitset_storage_enabled():
+        achieved_count = sum(
+            len(RiddleBitset.from_bytes(bits))
+            for bits in Member.objects.values_list('achieved_riddles_bits', flat=True).iterator()
+        )
+    else:
+        achieved_count = Member.achieved_riddles.through.objects.count()
+    values = {
+        'total_clans': Clan.objects.count(),
+        'total_defis_realises': achieved_count,
+        'total_scores': Member.objects.aggregate(score_sum=Sum('member_score'))['score_sum'] or 0,
+    }
+    cache.set_many({
+        COUNTER_KEYS['total_clans']: values['total_clans'],
+        COUNTER_KEYS['total_defis_realises']: values['total_defis_realises'],
+        COUNTER_KEYS['total_scores']: round(values['total_scores'] * SCORE_SCALE),
+    }, None)
+    return values
+
+
+def _read_counters():
+    counters = cache.get_many(COUNTER_KEYS.values())
+    if len(counters) < len(COUNTER_KEYS):
+        return reconcile()
+    return {
+        'total_clans': counters[COUNTER_KEYS['total_clans']],
+        'total_defis_realises': counters[COUNTER_KEYS['total_defis_realises']],
+        'total_scores': counters[COUNTER_KEYS['total_scores']] / SCORE_SCALE,
+    }
+
+
+class GlobalStatsSnapshot:
+    """
+    Statistiques globales servies depuis la mémoire du processus (stale-while-revalidate) :
+    au-delà de FRESH_TTL, l'instantané périmé est renvoyé immédiatement et un seul thread
+    le rafraîchit depuis les compteurs ; au-delà de STALE_TTL, la lecture est synchrone.
+    """
+
+    def __init__(self, fresh_ttl=FRESH_TTL, stale_ttl=STALE_TTL):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self._lock = Lock()
+        self._value = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+
+    def _refresh(self):
+        value = _read_counters()
+        with self._lock:
+            self._value = value
+            self._fetched_at = time.monotonic()
+        return value
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except Exception:
+            logger.error("Rafraîchissement des statistiques globales impossible", exc_info=True)
+        finally:
+            self._refreshing = False
+            connections.close_all()  # Connexions ouvertes par ce thread
+
+    def get(self):
+        age = time.monotonic() - self._fetched_at
+        if self._value is None or age >= self.stale_ttl:
+            return self._refresh()
+        if age >= self.fresh_ttl:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                Thread(target=self._refresh_in_background, daemon=True).start()
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+
+global_stats = GlobalStatsSnapshot()
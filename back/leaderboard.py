@@ -0,0 +1,168 @@
+import logging
+from bisect import bisect_left, insort
+from threading import Lock
+from django.conf import settings
+
+logger = logging.getLogger('custom_logger')
+
+
+class InMemorySortedSet:
+    """
+    Équivalent en mémoire d'un sorted set Redis (pour les tests et le développement local).
+    Les entrées sont classées par score décroissant.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._scores = {}
+        self._entries = []  # liste triée de (-score, member)
+
+    def add(self, member, score):
+        with self._lock:
+            self._discard(member)
+            self._scores[member] = score
+            insort(self._entries, (-score, member))
+
+    def remove(self, member):
+        with self._lock:
+            self._discard(member)
+
+    def _discard(self, member):
+        score = self._scores.pop(member, None)
+        if score is not None:
+            index = bisect_left(self._entries, (-score, member))
+            del self._entries[index]
+
+    def rank(self, member):
+        """Rang (0 = premier) du membre, ou None s'il n'est pas indexé."""
+        with self._lock:
+            score = self._scores.get(member)
+            if score is None:
+                return None
+            return bisect_left(self._entries, (-score, member))
+
+    def range(self, start, stop):
+        """Entrées [start, stop] (bornes incluses, comme ZREVRANGE) sous forme de (member, score)."""
+        with self._lock:
+            return [(member, -score) for score, member in self._entries[start:stop + 1]]
+
+    def count(self):
+        return len(self._scores)
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self._entries.clear()
+
+
+class RedisSortedSet:
+    """Sorted set Redis (ZADD / ZREVRANK / ZREVRANGE), même interface que InMemorySortedSet."""
+
+    def __init__(self, url, key):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._key = key
+
+    def add(self, member, score):
+        self._client.zadd(self._key, {member: score})
+
+    def remove(self, member):
+        self._client.zrem(self._key, member)
+
+    def rank(self, member):
+        return self._client.zrevrank(self._key, member)
+
+    def range(self, start, stop):
+        entries = self._client.zrevrange(self._key, start, stop, withscores=True)
+        return [(int(member), score) for member, score in entries]
+
+    def count(self):
+        return self._client.zcard(self._key)
+
+    def clear(self):
+        self._client.delete(self._key)
+
+
+class ClanLeaderboard:
+    """
+    Classement des clans par élo, tenu à jour à chaque changement d'élo.
+    Top N, rang d'un clan et fenêtre autour d'un clan en O(log n), sans toucher à la table Member.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def update(self, clan_id, clan_elo):
+        self.index.add(clan_id, clan_elo)
+
+    def remove(self, clan_id):
+        self.index.remove(clan_id)
+
+    def rebuild(self):
+        from .models import Clan
+
+        self.index.clear()
+        for clan_id, clan_elo in Clan.objects.values_list('clan_id', 'clan_elo'):
+            self.index.add(clan_id, clan_elo)
+
+    def ensure_loaded(self):
+        """Reconstruit l'index depuis la table Clan s'il est vide (redémarrage de Redis, premier appel...)."""
+        from .models import Clan
+
+        if self.index.count() == 0 and Clan.objects.exists():
+            self.rebuild()
+
+    def top(self, limit, offset=0):
+        """Liste de (clan_id, élo) pour les rangs offset+1 à offset+limit."""
+        if limit <= 0:
+            return []
+        return self.index.range(offset, offset + limit - 1)
+
+    def rank_of(self, clan_id):
+        """Rang du clan (1 = premier), ou None."""
+        rank = self.index.rank(clan_id)
+        return None if rank is None else rank + 1
+
+    def around(self, clan_id, radius):
+        """
+        Fenêtre de `radius` clans de part et d'autre du clan.
+        Retourne (offset, entrées) ou (None, []) si le clan n'est pas classé.
+        """
+        rank = self.index.rank(clan_id)
+        if rank is None:
+            return None, []
+        offset = max(rank - radius, 0)
+        return offset, self.index.range(offset, rank + radius)
+
+
+_clan_leaderboard = None
+_clan_leaderboard_lock = Lock()
+
+
+def clan_leaderboard():
+    global _clan_leaderboard
+    if _clan_leaderboard is None:
+        with _clan_leaderboard_lock:
+            if _clan_leaderboard is None:
+                config = settings.LEADERBOARD
+                if config['BACKEND'] == 'redis':
+                    index = RedisSortedSet(config['URL'], f"{config['KEY_PREFIX']}:clans")
+                else:
+                    index = InMemorySortedSet()
+                _clan_leaderboard = ClanLeaderboard(index)
+    return _clan_leaderboard
+
+
+def publish_clan_elo(clan_id, clan_elo):
+    """Met à jour le classement ; une panne de l'index ne doit pas faire échouer la requête."""
+    try:
+        clan_leaderboard().update(clan_id, clan_elo)
+    except Exception:
+        logger.warning(f"Impossible de mettre à jour le classement du clan {clan_id}", exc_info=True)
+
+
+def unpublish_clan(clan_id):
+    try:
+        clan_leaderboard().remove(clan_id)
+    except Exception:
+        logger.warning(f"Impossible de retirer le clan {clan_id} du classement", exc_info=True)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.core.cache import cache
+from django.utils.crypto import get_random_string
+from .models import User
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class LoginUnavailable(Exception):
+    """Trop de vérifications de mot de passe en cours : la demande est refusée plutôt que mise en attente."""
+
+
+class TokenBucket:
+    """
+    Seau à jetons stocké dans le cache (partagé entre les workers) : `capacity` jetons,
+    rechargés au rythme de `refill_rate` jetons par seconde. La lecture-écriture n'est pas
+    atomique : sous forte concurrence le seau peut laisser passer quelques essais de plus.
+    """
+
+    def __init__(self, prefix, capacity, refill_rate):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def _state(self, key):
+        tokens, updated_at = cache.get(f"{self.prefix}:{key}", (self.capacity, time.time()))
+        now = time.time()
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate), now
+
+    def retry_after(self, key):
+        """Secondes avant qu'un jeton soit disponible (0 s'il y en a un)."""
+        tokens, _ = self._state(key)
+        return 0 if tokens >= 1 else (1 - tokens) / self.refill_rate
+
+    def consume(self, key):
+        tokens, now = self._state(key)
+        timeout = int(self.capacity / self.refill_rate) + 1  # Un seau plein n'a pas besoin d'être stocké
+        cache.set(f"{self.prefix}:{key}", (max(tokens - 1, 0), now), timeout)
+
+
+class LoginEngine:
+    """
+    Vérification des identifiants pour LogInView :
+    - limitation par IP et par nom d'utilisateur (seaux à jetons) avant tout calcul de hash ;
+    - une seule lecture de l'utilisateur ;
+    - hash calculé dans un pool de threads borné, attendu sans bloquer la boucle asyncio,
+      et aussi pour un utilisateur inconnu, pour que le temps de réponse ne révèle pas l'existence du compte.
+    """
+
+    def __init__(self, config):
+        self.ip_bucket = TokenBucket('login:ip', *config['IP_RATE'])
+        self.username_bucket = TokenBucket('login:username', *config['USERNAME_RATE'])
+        self.hash_timeout = config['HASH_TIMEOUT']
+        self.trusted_proxies = config['TRUSTED_PROXIES']
+        self._pool = ThreadPoolExecutor(max_workers=config['HASH_WORKERS'], thread_name_prefix='login-hash')
+        # Au plus HASH_WORKERS calculs en cours et autant en file d'attente
+        self._slots = BoundedSemaphore(config['HASH_WORKERS'] * 2)
+        self._dummy_password = None
+
+    def client_ip(self, request):
+        """
+        Adresse du client. Derrière TRUSTED_PROXIES proxys, chacun ajoute à droite de X-Forwarded-For
+        l'adresse qu'il a vue : seules les TRUSTED_PROXIES dernières valeurs sont fiables,
+        les précédentes sont fournies par le client.
+        """
+        if self.trusted_proxies:
+            forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return request.META.get('REMOTE_ADDR', '')
+
+    async def _run_hash(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise LoginUnavailable()
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self._pool.submit(function, *args)), self.hash_timeout)
+        except asyncio.TimeoutError:
+            raise LoginUnavailable()
+        finally:
+            self._slots.release()
+
+    async def _dummy_encoded(self):
+        if self._dummy_password is None:
+            # Vrai hash (et non un mot de passe inutilisable) : même coût que pour un compte existant
+            self._dummy_password = await self._run_hash(make_password, get_random_string(32))
+        return self._dummy_password
+
+    def _throttle(self, ip, username_key):
+        retry_after = max(self.ip_bucket.retry_after(ip), self.username_bucket.retry_after(username_key))
+        if retry_after:
+            raise LoginThrottled(retry_after)
+        self.ip_bucket.consume(ip)
+
+    async def authenticate(self, request, username, password):
+        """
+        Retourne l'utilisateur si les identifiants sont valides (actif ou non), None sinon.
+        Lève LoginThrottled ou LoginUnavailable.
+        """
+        username_key = str(username).lower()
+        await sync_to_async(self._throttle)(self.client_ip(request), username_key)
+
+        user = await (
+            User.objects.filter(username=username)
+            .only('id', 'username', 'password', 'is_active')
+            .afirst()
+        ) if username and password else None
+
+        encoded = user.password if user else await self._dummy_encoded()
+        valid = await self._run_hash(check_password, password, encoded) and user is not None
+        if not valid:
+            await sync_to_async(self.username_bucket.consume)(username_key)
+            return None
+
+        # Hash obsolète (algorithme ou nombre d'itérations) : on le met à jour
+        hasher = get_hasher()
+        if identify_hasher(user.password).algorithm != hasher.algorithm or hasher.must_update(user.password):
+            user.password = await self._run_hash(make_password, password)
+            await User.objects.filter(pk=user.pk).aupdate(password=user.password)
+        return user
+
+
+_login_engine = None
+_login_engine_lock = Lock()
+
+
+def login_engine():
+    global _login_engine
+    if _login_engine is None:
+        with _login_engine_lock:
+            if _login_engine is None:
+                _login_engine = LoginEngine(settings.LOGIN)
+    return _login_engine
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from back.bitsets import RiddleBitset, bits_field_name
+from back.models import Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Convertit l'état des membres (énigmes réussies/verrouillées, indices) entre les tables M2M "
+        "et les bitmaps compacts de Member. À lancer avant de changer MEMBER_STATE_STORAGE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['bitset', 'm2m'], required=True)
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help="Supprime les données de l'ancien stockage après conversion.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['to'] == 'bitset':
+                count = self.m2m_to_bitset(options['batch_size'], options['purge'])
+            else:
+                count = self.bitset_to_m2m(options['batch_size'], options['purge'])
+        self.stdout.write(self.style.SUCCESS(f"{count} membre(s) converti(s) vers '{options['to']}'."))
+
+    def m2m_to_bitset(self, batch_size, purge):
+        members = {member.pk: member for member in Member.objects.only('pk')}
+        for relation in Member.STATE_RELATIONS:
+            field = Member._meta.get_field(relation)
+            through = field.remote_field.through
+            target_column = field.m2m_reverse_name()  # 'riddle_id' ou 'clue_id'
+            bitsets = {}
+            for member_id, target_id in through.objects.values_list('member_id', target_column):
+                bitsets.setdefault(member_id, RiddleBitset()).add(target_id)
+            for member_id, member in members.items():
+                setattr(member, bits_field_name(relation), bitsets.get(member_id, RiddleBitset()).to_bytes())
+            if purge:
+                through.objects.all().delete()
+
+        fields = [bits_field_name(relation) for relation in Member.STATE_RELATIONS]
+        Member.objects.bulk_update(members.values(), fields, batch_size=batch_size)
+        return len(members)
+
+    def bitset_to_m2m(self, batch_size, purge):
+        fields = [bits_field_name(relation) for relation in Member.STATE_RELATIONS]
+        members = list(Member.objects.only('pk', *fields))
+        for relation in Member.STATE_RELATIONS:
+            field = Member._meta.get_field(relation)
+            through = field.remote_field.through
+            target_column = field.m2m_reverse_name()
+            through.objects.all().delete()
+            through.objects.bulk_create(
+                (
+                    through(member_id=member.pk, **{target_column: target_id})
+                    for member in members
+                    for target_id in RiddleBitset.from_bytes(getattr(member, bits_field_name(relation)))
+                ),
+                batch_size=batch_size,
+            )
+
+        if purge:
+            Member.objects.update(**{field: b'' for field in fields})
+        return len(members)
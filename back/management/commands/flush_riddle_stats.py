@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from back.stats_buffer import riddle_stats_buffer
+
+
+class Command(BaseCommand):
+    help = "Écrit en base les incréments de statistiques d'énigmes en attente (en boucle avec --interval)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help="Intervalle en secondes entre deux flush ; 0 pour un seul flush.",
+        )
+
+    def handle(self, *args, **options):
+        buffer = riddle_stats_buffer()
+        while True:
+            count = buffer.flush()
+            if count:
+                self.stdout.write(f"{count} statistique(s) mise(s) à jour.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
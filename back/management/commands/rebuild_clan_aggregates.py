@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from back.models import Clan, Member
+from back.leaderboard import clan_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recalcule depuis zéro la somme des scores, l'effectif et l'élo de chaque clan."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clans = list(Clan.objects.select_for_update().only('clan_id'))
+            # Agrégats lus après le verrouillage : un apply_aggregates_delta concurrent attend
+            # le commit et s'applique ensuite aux valeurs recalculées
+            totals = {
+                row['clan_id']: row
+                for row in Member.objects.filter(clan__isnull=False)
+                .values('clan_id')
+                .annotate(total_score=Sum('member_score'), members_count=Count('pk'))
+            }
+            for clan in clans:
+                row = totals.get(clan.clan_id, {})
+                clan.clan_score_sum = row.get('total_score') or 0.0
+                clan.clan_members_count = row.get('members_count', 0)
+                clan.clan_elo = Clan.compute_elo(clan.clan_score_sum, clan.clan_members_count)
+            Clan.objects.bulk_update(clans, ['clan_score_sum', 'clan_members_count', 'clan_elo'], batch_size=500)
+
+        clan_leaderboard().rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"{len(clans)} clan(s) recalculé(s)."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from back.models import Member
+
+
+class Command(BaseCommand):
+    help = "Recalcule depuis zéro l'histogramme des thèmes des énigmes réussies de chaque membre."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            members = list(Member.objects.select_for_update().only('user_id'))
+            # Calcul après le verrouillage : une résolution concurrente attend, ou est déjà comptée
+            histograms = Member.compute_theme_histograms()
+            for member in members:
+                member.theme_histogram = histograms.get(member.pk, {})
+            Member.objects.bulk_update(members, ['theme_histogram'], batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"{len(members)} histogramme(s) recalculé(s)."))
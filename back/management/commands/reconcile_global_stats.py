@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from back.global_stats import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recalcule les valeurs exactes des statistiques globales (en boucle avec --interval)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help="Intervalle en secondes entre deux recalculs ; 0 pour un seul recalcul.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            values = reconcile()
+            self.stdout.write(
+                f"{values['total_clans']} clan(s), {values['total_defis_realises']} défi(s), "
+                f"{values['total_scores']} point(s)."
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
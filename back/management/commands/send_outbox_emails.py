@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.timezone import now
+from back.models import OutboundEmail
+
+logger = logging.getLogger('custom_logger')
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les e-mails en attente de l'outbox par lots, en réutilisant une seule connexion "
+        "par lot ; les échecs sont réessayés avec un délai exponentiel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=6)
+        parser.add_argument('--backoff', type=float, default=30, help="Délai en secondes avant le premier nouvel essai.")
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help="Attente en secondes quand l'outbox est vide ; 0 pour vider l'outbox une seule fois.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            while True:
+                sent, failed = self.send_batch(options)
+                if not sent and not failed:
+                    break
+                self.stdout.write(f"{sent} e-mail(s) envoyé(s), {failed} échec(s).")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def send_batch(self, options):
+        """Envoie un lot d'e-mails dus ; retourne (envoyés, échecs)."""
+        with transaction.atomic():
+            # skip_locked : plusieurs workers peuvent vider l'outbox en parallèle
+            emails = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now())
+                .order_by('next_attempt_at', 'pk')[:options['batch_size']]
+            )
+            if not emails:
+                return 0, 0
+
+            sent = failed = 0
+            connection = get_connection()
+            try:
+                connection.open()
+            except Exception as e:
+                # Serveur injoignable : tout le lot est reporté
+                logger.error("Connexion au serveur d'e-mails impossible", exc_info=True)
+                for email in emails:
+                    self.mark_failed(email, e, options)
+                failed = len(emails)
+            else:
+                try:
+                    for email in emails:
+                        try:
+                            EmailMessage(
+                                subject=email.subject,
+                                body=email.body,
+                                from_email=email.from_email,
+                                to=email.recipients,
+                                connection=connection,
+                            ).send()
+                        except Exception as e:
+                            self.mark_failed(email, e, options)
+                            failed += 1
+                        else:
+                            email.status = 'sent'
+                            email.sent_at = now()
+                            email.attempts += 1
+                            sent += 1
+                finally:
+                    connection.close()
+
+            OutboundEmail.objects.bulk_update(
+                emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+            )
+        return sent, failed
+
+    def mark_failed(self, email, error, options):
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= options['max_attempts']:
+            email.status = 'failed'
+            logger.error(f"Abandon de l'envoi de l'e-mail {email.pk} après {email.attempts} essais : {error}")
+        else:
+            email.next_attempt_at = now() + timedelta(seconds=options['backoff'] * 2 ** (email.attempts - 1))
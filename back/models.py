@@ -1,8 +1,35 @@
 from django.utils.timezone import now
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from math import log2
+from .riddle_graph import riddle_graph, locked_riddles_cache_key, LOCKED_RIDDLES_TIMEOUT
+from .leaderboard import publish_clan_elo
+from .bitsets import RiddleBitset, MemberStateDescriptor, bitset_storage_enabled, bits_field_name
 
+############################################################################################################################
+# region Counters
+
+class AtomicCounterMixin:
+    """
+    Mises à jour de compteurs par expressions F() : chaque appel émet un seul
+    `UPDATE ... SET x = x + n` sur les colonnes concernées, sans perte de mise à jour
+    entre requêtes concurrentes. Les valeurs à jour sont relues dans l'instance.
+    """
+
+    def update_expressions(self, **expressions):
+        for field, expression in expressions.items():
+            setattr(self, field, expression)
+        self.save(update_fields=list(expressions))
+        self.refresh_from_db(fields=list(expressions))
+
+    def increment(self, field, n=1):
+        self.update_expressions(**{field: F(field) + n})
+
+# endregion
 ############################################################################################################################
 # region Users
 
@@ -112,66 +139,162 @@ class Member(models.Model):
         related_name='revealed_by_members',
         verbose_name="Indices utilisés"
     )
+
+    # Stockage compact optionnel (MEMBER_STATE_STORAGE = 'bitset') : un bitmap d'ids par relation d'état.
+    # Les accesseurs M2M ci-dessus restent utilisables grâce à MemberStateDescriptor (voir back/bitsets.py).
+    achieved_riddles_bits = models.BinaryField(default=b'', blank=True)
+    locked_riddles_bits = models.BinaryField(default=b'', blank=True)
+    achieved_coop_riddles_bits = models.BinaryField(default=b'', blank=True)
+    locked_coop_riddles_bits = models.BinaryField(default=b'', blank=True)
+    revealed_clues_bits = models.BinaryField(default=b'', blank=True)
+
+    # Nombre d'énigmes solo réussies par thème ({"cryptographie": 4, ...}), tenu à jour à chaque résolution
+    # (voir back/solving.py) et recalculable avec la commande rebuild_theme_histograms.
+    # None : pas encore calculé (membres antérieurs au champ), calculé à la première lecture (fill_theme_histograms).
+    theme_histogram = models.JSONField(null=True, blank=True)
+
+    STATE_RELATIONS = (
+        'achieved_riddles',
+        'locked_riddles',
+        'achieved_coop_riddles',
+        'locked_coop_riddles',
+        'revealed_clues',
+    )
     
+    class Meta:
+        indexes = [
+            # Classement global : tri par score décroissant, départage par user_id (pagination par curseur)
+            models.Index(fields=['-member_score', 'user'], name='member_score_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - Rank : {self.rank} - Score: {self.member_score}"
     
     def add_riddle_to_achieved(self, riddle):
-        """Add a riddle to the list of achieved riddles."""
-        self.achieved_riddles.add(riddle)
-
-        all_riddles = Riddle.objects.all()
-        for other_riddle in all_riddles:
-            if riddle in other_riddle.riddle_dependance.all():
-                if other_riddle in self.locked_riddles.all():
-                    self.locked_riddles.remove(other_riddle)
-
-        riddle_clues = Clue.objects.filter(riddle=riddle) # Get all clues of the riddle
-        riddle_ids = riddle_clues.values_list('riddle_id', flat=True)
-        revealed_riddle_clues = self.revealed_clues.filter(riddle__in=riddle_ids)
-        revealed_clues_count = revealed_riddle_clues.count()
-
-        # Calculate the percentage of points to add depending on the number of revealed clues
-        if revealed_clues_count == 1:
-            percentage = 0.75
-        elif revealed_clues_count == 2:
-            percentage = 0.5
-        elif revealed_clues_count == 3:
-            percentage = 0.25
-        else:
-            percentage = 1.0
-
-        self.member_score += riddle.riddle_points * percentage
-        self.update_rank_according_to_score()
-        self.save()
+        """
+        Add a riddle to the list of achieved riddles.
+        Met à jour le score, le rang et l'élo du clan dans une seule transaction (voir back/solving.py).
+        """
+        from .solving import solve_riddle
+        solved = solve_riddle(self, riddle)
+        self.refresh_from_db(fields=['member_score', 'rank'])
+        return solved
 
     def add_coop_riddle_to_achieved(self, riddle):
         """Add a riddle to the list of achieved coop riddles."""
-        self.achieved_coop_riddles.add(riddle)
-
-        all_riddles = Riddle.objects.all()
-        for other_riddle in all_riddles:
-            if riddle in other_riddle.riddle_dependance.all():
-                if other_riddle in self.locked_coop_riddles.all():
-                    self.locked_coop_riddles.remove(other_riddle)
-
-        riddle_clues = Clue.objects.filter(riddle=riddle)
-        riddle_ids = riddle_clues.values_list('riddle_id', flat=True)
-        revealed_riddle_clues = self.revealed_clues.filter(riddle__in=riddle_ids)
-        revealed_clues_count = revealed_riddle_clues.count()
-
-        if revealed_clues_count == 1:
-            percentage = 0.75
-        elif revealed_clues_count == 2:
-            percentage = 0.5
-        elif revealed_clues_count == 3:
-            percentage = 0.25
+        from .solving import solve_coop_riddle
+        solved = solve_coop_riddle(self, riddle)
+        self.refresh_from_db(fields=['member_clan_score'])
+        return solved
+
+    def change_clan(self, clan, is_clan_admin=False):
+        """
+        Change le clan du membre et ajuste les agrégats (somme des scores, effectif)
+        de l'ancien et du nouveau clan.
+        """
+        from .authentication import invalidate_cached_user
+
+        new_clan_id = clan.pk if clan else None
+        with transaction.atomic():
+            locked_member = Member.objects.select_for_update().only('clan_id', 'member_score').get(pk=self.pk)
+            old_clan_id = locked_member.clan_id
+            Member.objects.filter(pk=self.pk).update(clan_id=new_clan_id, is_clan_admin=is_clan_admin)
+            if old_clan_id != new_clan_id:
+                if old_clan_id:
+                    Clan.apply_aggregates_delta(old_clan_id, -locked_member.member_score, -1)
+                if new_clan_id:
+                    Clan.apply_aggregates_delta(new_clan_id, locked_member.member_score, 1)
+            transaction.on_commit(lambda: invalidate_cached_user(self.pk))
+        self.clan = clan
+        self.is_clan_admin = is_clan_admin
+
+    def riddle_bits(self, relation):
+        """Ids d'une relation d'état (ex: 'achieved_riddles') sous forme de RiddleBitset, quel que soit le stockage."""
+        if bitset_storage_enabled():
+            return RiddleBitset.from_bytes(getattr(self, bits_field_name(relation)))
+        return RiddleBitset(getattr(self, relation).values_list('pk', flat=True))
+
+    def locked_riddle_ids(self):
+        """
+        Énigmes verrouillées, déduites des énigmes réussies et du graphe de dépendances
+        (rien n'est stocké à l'inscription). Mémorisé par membre, invalidé à chaque résolution.
+        """
+        from .catalogue import catalogue_version
+
+        version = catalogue_version()
+        key = locked_riddles_cache_key(self.pk, version)
+        locked_ids = cache.get(key)
+        if locked_ids is None:
+            locked_ids = sorted(riddle_graph.locked_riddle_ids(self.riddle_bits('achieved_riddles'), version))
+            cache.set(key, locked_ids, LOCKED_RIDDLES_TIMEOUT)
+        return locked_ids
+
+    @classmethod
+    def compute_theme_histograms(cls, member_ids=None):
+        """Histogrammes des thèmes recalculés depuis les énigmes réussies : {member_id: histogramme} (tous si None)."""
+        histograms = {}
+        if bitset_storage_enabled():
+            themes = dict(Riddle.objects.values_list('riddle_id', 'riddle_theme'))
+            members = cls.objects.all() if member_ids is None else cls.objects.filter(pk__in=member_ids)
+            for member_id, bits in members.values_list('pk', 'achieved_riddles_bits').iterator():
+                histogram = histograms.setdefault(member_id, {})
+                for riddle_id in RiddleBitset.from_bytes(bits):
+                    if riddle_id in themes:
+                        histogram[themes[riddle_id]] = histogram.get(themes[riddle_id], 0) + 1
+        else:
+            rows = cls.achieved_riddles.through.objects.all()
+            if member_ids is not None:
+                rows = rows.filter(member_id__in=member_ids)
+            for row in rows.values('member_id', 'riddle__riddle_theme').annotate(count=Count('pk')):
+                histograms.setdefault(row['member_id'], {})[row['riddle__riddle_theme']] = row['count']
+        return histograms
+
+    @classmethod
+    def fill_theme_histograms(cls, members):
+        """
+        Calcule et enregistre les histogrammes encore absents (None) des membres donnés.
+        Les lignes sont verrouillées comme lors d'une résolution : une résolution concurrente
+        est soit déjà comptée, soit appliquée ensuite à l'histogramme enregistré.
+        """
+        missing = {member.pk: member for member in members if member.theme_histogram is None}
+        if not missing:
+            return
+        with transaction.atomic():
+            member_ids = list(
+                cls.objects.select_for_update()
+                .filter(pk__in=missing, theme_histogram__isnull=True)
+                .values_list('pk', flat=True)
+            )
+            histograms = cls.compute_theme_histograms(member_ids)
+            for member_id in member_ids:
+                missing[member_id].theme_histogram = histograms.get(member_id, {})
+            cls.objects.bulk_update([missing[member_id] for member_id in member_ids], ['theme_histogram'])
+        for member in missing.values():
+            if member.theme_histogram is None:
+                # Calculé entre-temps par une autre requête
+                member.refresh_from_db(fields=['theme_histogram'])
+
+    @staticmethod
+    def theme_distribution(histogram):
+        """Répartition en pourcentages d'un histogramme de thèmes (ex: {"cryptographie": 80.0, "math": 20.0})."""
+        total = sum(histogram.values())
+        if total <= 0:
+            return {}
+        return {theme: round((count / total) * 100, 2) for theme, count in histogram.items() if count}
+
+    def unlock_dependent_riddles(self, riddle, locked_field):
+        """
+        Retire des énigmes verrouillées celles qui dépendent directement de `riddle`.
+        `locked_field` est le descripteur M2M (Member.locked_riddles ou Member.locked_coop_riddles).
+        """
+        dependent_ids = riddle_graph.dependents_of(riddle.riddle_id)
+        if not dependent_ids:
+            return
+        if bitset_storage_enabled():
+            getattr(self, locked_field.field.name).remove(*dependent_ids)
         else:
-            percentage = 1.0
+            locked_field.through.objects.filter(member=self, riddle_id__in=dependent_ids).delete()
 
-        self.member_clan_score += riddle.riddle_points * percentage
-        self.save()
-        
     def update_rank_according_to_score(self):
         new_rank = (
             Rank.objects.filter(min_score__lte=self.member_score)
@@ -181,7 +304,7 @@ class Member(models.Model):
         
         if new_rank and new_rank != self.rank:
             self.rank = new_rank
-            self.save()
+            self.save(update_fields=['rank'])
 
     def lock_riddle(self, riddle):
         """Add a riddle to the list of locked riddles."""
@@ -189,6 +312,10 @@ class Member(models.Model):
             self.locked_riddles.add(riddle)
     
     
+for relation in Member.STATE_RELATIONS:
+    setattr(Member, relation, MemberStateDescriptor(Member.__dict__[relation], relation))
+    
+    
 class Recruiter(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
 
@@ -253,7 +380,7 @@ class Riddle(models.Model):
         return f"Riddle {self.riddle_id} ({self.riddle_theme})"
     
 
-class MemberRiddleStats(models.Model):
+class MemberRiddleStats(AtomicCounterMixin, models.Model):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name="riddle_stats")
     riddle = models.ForeignKey(Riddle, on_delete=models.CASCADE, related_name="member_stats")
     try_count = models.PositiveIntegerField(default=0, verbose_name="Nombre d'essais")
@@ -272,21 +399,19 @@ class MemberRiddleStats(models.Model):
 
     def mark_solved(self):
         """Marque l'énigme comme résolue et met à jour les statistiques associées."""
-        if not self.is_solved:
-            self.is_solved = True
-            self.first_solved_at = now()
-        self.solve_count += 1
-        self.save()
+        self.update_expressions(
+            solve_count=F('solve_count') + 1,
+            is_solved=True,
+            first_solved_at=Coalesce(F('first_solved_at'), now()),
+        )
 
     def increment_errors(self):
         """Incrémente le compteur d'erreurs."""
-        self.errors_count += 1
-        self.save()
+        self.increment('errors_count')
 
     def increment_tries(self):
         """Incrémente le compteur d'essais."""
-        self.try_count += 1
-        self.save()
+        self.increment('try_count')
     
 
 class Clue(models.Model):
@@ -369,23 +494,55 @@ class Clan(models.Model):
     clan_members_count = models.PositiveIntegerField(default=0)
     clan_members_max_count = models.PositiveIntegerField(default=10)
     clan_elo = models.FloatField(default=0.0)
+    clan_score_sum = models.FloatField(default=0.0)  # Somme des member_score, maintenue incrémentalement
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.clan_name
     
+    @staticmethod
+    def compute_elo(score_sum, members_count):
+        if members_count <= 0:
+            return 0.0  # Aucun membre, pas d'élo
+        return (score_sum / members_count) * log2(members_count + 1)
+
+    @classmethod
+    def apply_aggregates_delta(cls, clan_id, score_delta=0.0, members_delta=0):
+        """
+        Ajuste les agrégats stockés du clan (somme des scores, nombre de membres)
+        et recalcule l'élo à partir d'eux, sans relire les membres.
+        """
+        with transaction.atomic():
+            clan = cls.objects.select_for_update().only('clan_score_sum', 'clan_members_count').get(pk=clan_id)
+            score_sum = clan.clan_score_sum + score_delta
+            members_count = max(clan.clan_members_count + members_delta, 0)
+            clan_elo = cls.compute_elo(score_sum, members_count)
+            cls.objects.filter(pk=clan_id).update(
+                clan_score_sum=score_sum,
+                clan_members_count=members_count,
+                clan_elo=clan_elo,
+            )
+            transaction.on_commit(lambda: publish_clan_elo(clan_id, clan_elo))
+        return clan_elo
+
     def update_elo(self):
         """
-        Met à jour l'élo du clan en fonction des scores des membres.
+        Recalcule entièrement les agrégats et l'élo du clan à partir des scores des membres.
+        Sert à corriger une éventuelle dérive (voir la commande rebuild_clan_aggregates).
         """
-        members = Member.objects.filter(clan=self)  # Récupérer les membres liés à ce clan
-        members_count = members.count()
-        if members_count == 0:
-            self.clan_elo = 0.0  # Aucun membre, pas d'élo
-        else:
-            total_score = sum(member.member_score for member in members)
-            self.clan_elo = (total_score / members_count) * log2(members_count + 1)
-        self.save()
+        totals = Member.objects.filter(clan=self).aggregate(
+            total_score=Sum('member_score'),
+            members_count=Count('pk'),
+        )
+        self.clan_score_sum = totals['total_score'] or 0.0
+        self.clan_members_count = totals['members_count']
+        self.clan_elo = self.compute_elo(self.clan_score_sum, self.clan_members_count)
+        Clan.objects.filter(pk=self.pk).update(
+            clan_score_sum=self.clan_score_sum,
+            clan_members_count=self.clan_members_count,
+            clan_elo=self.clan_elo,
+        )
+        publish_clan_elo(self.pk, self.clan_elo)
     
 class CoopInvitation(models.Model):
     STATUS_CHOICES = [
@@ -406,6 +563,34 @@ class CoopInvitation(models.Model):
     def __str__(self):
         return f"Invitation de {self.inviter.user.username} à {self.invitee.user.username} pour {self.riddle.riddle_type} ({self.status})"
 
+
+class Notification(models.Model):
+    """
+    Boîte de réception d'un membre : chaque notification est conservée jusqu'à sa lecture,
+    poussée en direct si le membre est connecté (NotificationConsumer) et renvoyée à sa
+    prochaine connexion sinon.
+    """
+    KIND_CHOICES = [
+        ('coop_invitation', 'Invitation coop'),
+        ('message', 'Message'),
+    ]
+
+    recipient = models.ForeignKey('Member', on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='message')
+    message = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'read_at', '-created_at'], name='notification_inbox_idx'),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} pour {self.recipient_id} ({'lue' if self.read_at else 'non lue'})"
+
 # endregion
 ########################################################################################################
 # region Play
@@ -422,5 +607,50 @@ class Compete(models.Model):
 # endregion
 
 
+########################################################################################################
+# region Emails
+
 
+class OutboundEmail(models.Model):
+    """
+    File d'attente (outbox) des e-mails : écrite dans la même transaction que l'action qui les
+    déclenche, puis envoyée hors requête par la commande send_outbox_emails.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('sent', 'Envoyé'),
+        ('failed', 'Échec'),
+    ]
 
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+        verbose_name = "E-mail sortant"
+        verbose_name_plural = "E-mails sortants"
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, subject, message, recipient_list, from_email=None):
+        """Même signature que send_mail : met l'e-mail en file au lieu de l'envoyer."""
+        return cls.objects.create(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list),
+        )
+
+# endregion
@@ -0,0 +1,37 @@
+from django.utils.timezone import now
+from .events import publish
+from .models import Notification
+from .serializers import NotificationSerializer
+
+# Notifications non lues renvoyées à la connexion
+INBOX_DELIVERY_LIMIT = 50
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def notify(member_id, kind, message, data=None):
+    """
+    Ajoute une notification à la boîte de réception du membre et la pousse, après le commit,
+    à ses sockets connectées. Hors ligne, elle lui sera remise à sa prochaine connexion.
+    """
+    notification = Notification.objects.create(recipient_id=member_id, kind=kind, message=message, data=data or {})
+    payload = NotificationSerializer(notification).data
+    publish(user_group(member_id), {'type': 'send_notification', 'notification': payload})
+    return notification
+
+
+def unread_notifications(member_id, limit=INBOX_DELIVERY_LIMIT):
+    notifications = Notification.objects.filter(recipient_id=member_id, read_at__isnull=True)[:limit]
+    return NotificationSerializer(notifications, many=True).data
+
+
+def mark_read(member_id, ids=None, kind=None):
+    """Marque comme lues les notifications `ids` (toutes si None) ; retourne leur nombre."""
+    notifications = Notification.objects.filter(recipient_id=member_id, read_at__isnull=True)
+    if ids is not None:
+        notifications = notifications.filter(pk__in=ids)
+    if kind is not None:
+        notifications = notifications.filter(kind=kind)
+    return notifications.update(read_at=now())
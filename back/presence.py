@@ -0,0 +1,96 @@
+import json
+import time
+from threading import Lock
+from django.conf import settings
+
+# Une salle sans activité depuis ce délai est oubliée (sockets perdues sans disconnect)
+PRESENCE_TIMEOUT = 24 * 60 * 60
+
+
+def _roster(entries):
+    """Liste [{username, role}] dédoublonnée (plusieurs onglets), dans l'ordre d'arrivée."""
+    roster = {}
+    for entry in sorted(entries, key=lambda item: item['joined_at']):
+        roster.setdefault(entry['username'], {'username': entry['username'], 'role': entry['role']})
+    return list(roster.values())
+
+
+class InMemoryPresence:
+    """Registre de présence local au processus (tests, développement)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._rooms = {}
+
+    def join(self, room, channel_name, username, role):
+        with self._lock:
+            entries = self._rooms.setdefault(room, {})
+            entries[channel_name] = {'username': username, 'role': role, 'joined_at': time.time()}
+            return _roster(entries.values())
+
+    def leave(self, room, channel_name):
+        with self._lock:
+            entries = self._rooms.get(room, {})
+            entry = entries.pop(channel_name, None)
+            if not entries:
+                self._rooms.pop(room, None)
+            return entry, _roster(entries.values())
+
+    def roster(self, room):
+        with self._lock:
+            return _roster(self._rooms.get(room, {}).values())
+
+
+class RedisPresence:
+    """
+    Registre de présence partagé entre les workers : un hash Redis par salle,
+    `<prefix>:<room>` -> {channel_name: {username, role, joined_at}}.
+    """
+
+    def __init__(self, url, prefix):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, room):
+        return f"{self._prefix}:{room}"
+
+    @staticmethod
+    def _entries(values):
+        return [json.loads(value) for value in values]
+
+    def join(self, room, channel_name, username, role):
+        entry = json.dumps({'username': username, 'role': role, 'joined_at': time.time()})
+        pipe = self._client.pipeline()
+        pipe.hset(self._key(room), channel_name, entry)
+        pipe.expire(self._key(room), PRESENCE_TIMEOUT)
+        pipe.hvals(self._key(room))
+        return _roster(self._entries(pipe.execute()[-1]))
+
+    def leave(self, room, channel_name):
+        pipe = self._client.pipeline()
+        pipe.hget(self._key(room), channel_name)
+        pipe.hdel(self._key(room), channel_name)
+        pipe.hvals(self._key(room))
+        entry, _, values = pipe.execute()
+        return (json.loads(entry) if entry else None), _roster(self._entries(values))
+
+    def roster(self, room):
+        return _roster(self._entries(self._client.hvals(self._key(room))))
+
+
+_coop_presence = None
+_coop_presence_lock = Lock()
+
+
+def coop_presence():
+    global _coop_presence
+    if _coop_presence is None:
+        with _coop_presence_lock:
+            if _coop_presence is None:
+                config = settings.COOP_PRESENCE
+                if config['BACKEND'] == 'redis':
+                    _coop_presence = RedisPresence(config['URL'], config['KEY_PREFIX'])
+                else:
+                    _coop_presence = InMemoryPresence()
+    return _coop_presence
@@ -0,0 +1,88 @@
+from threading import Lock
+from django.core.cache import cache
+
+
+LOCKED_RIDDLES_TIMEOUT = 60 * 60
+
+
+class RiddleDependencyGraph:
+    """
+    Index en mémoire des dépendances entre énigmes, construit à partir de la
+    table M2M `riddle_dependance`.
+
+    `dependents_of(riddle_id)` renvoie les énigmes qui dépendent directement
+    de `riddle_id` (index inversé), en une seule consultation de dictionnaire.
+    L'index est reconstruit paresseusement quand la version du catalogue change
+    (partagée entre les workers) ou après un appel à `invalidate()`.
+    Chaque méthode accepte la `version` déjà lue par l'appelant : pour un lot (liste de membres),
+    le cache n'est consulté qu'une fois au lieu d'une fois par appel.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._dependents = None
+        self._dependencies = None
+        self._version = None
+
+    def _build(self):
+        from .models import Riddle
+
+        dependents = {}
+        dependencies = {}
+        edges = Riddle.riddle_dependance.through.objects.values_list('from_riddle_id', 'to_riddle_id')
+        for riddle_id, dependency_id in edges:
+            dependents.setdefault(dependency_id, set()).add(riddle_id)
+            dependencies.setdefault(riddle_id, set()).add(dependency_id)
+        return dependents, dependencies
+
+    def _ensure_built(self, version=None):
+        if version is None:
+            from .catalogue import catalogue_version
+            version = catalogue_version()
+        if self._dependents is None or self._version != version:
+            with self._lock:
+                if self._dependents is None or self._version != version:
+                    self._dependents, self._dependencies = self._build()
+                    self._version = version
+
+    def dependents_of(self, riddle_id, version=None):
+        """Énigmes débloquées (directement) par la résolution de `riddle_id`."""
+        self._ensure_built(version)
+        return frozenset(self._dependents.get(riddle_id, ()))
+
+    def dependencies_of(self, riddle_id, version=None):
+        """Énigmes dont `riddle_id` dépend directement."""
+        self._ensure_built(version)
+        return frozenset(self._dependencies.get(riddle_id, ()))
+
+    def locked_riddle_ids(self, achieved_ids, version=None):
+        """
+        Énigmes verrouillées pour un ensemble d'énigmes réussies :
+        une énigme est verrouillée si l'une de ses dépendances n'est pas réussie.
+        """
+        self._ensure_built(version)
+        return {
+            riddle_id
+            for riddle_id, dependency_ids in self._dependencies.items()
+            if any(dependency_id not in achieved_ids for dependency_id in dependency_ids)
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._dependents = None
+            self._dependencies = None
+
+
+riddle_graph = RiddleDependencyGraph()
+
+
+def locked_riddles_cache_key(member_id, version=None):
+    # Les énigmes verrouillées mémorisées dépendent du graphe, donc de la version du catalogue
+    if version is None:
+        from .catalogue import catalogue_version
+        version = catalogue_version()
+    return f"member:{member_id}:locked_riddles:v{version}"
+
+
+def invalidate_locked_riddles(member_id):
+    cache.delete(locked_riddles_cache_key(member_id))
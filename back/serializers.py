@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import User, Riddle, Clue, Member, Clan, CV, CoopInvitation, MemberRiddleStats
+from .models import User, Riddle, Clue, Member, Clan, CV, CoopInvitation, MemberRiddleStats, Notification
+from .bitsets import bitset_storage_enabled
+from .riddle_graph import riddle_graph
 
 class UserSerializer(serializers.ModelSerializer):
     cv_url = serializers.SerializerMethodField()
@@ -56,8 +58,65 @@ class UserUpdateSerializer(serializers.ModelSerializer):
             'created_at',
             'is_staff',
         ]
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Seuls les champs envoyés sont écrits : l'instance peut venir du cache de l'authentification
+        # (jusqu'à 60 s de retard) et ne doit pas écraser des colonnes modifiées entre-temps
+        instance.save(update_fields=list(validated_data))
+        return instance
         
+MEMBER_RIDDLE_RELATIONS = [
+    'achieved_riddles',
+    'achieved_coop_riddles',
+    'locked_coop_riddles',
+]
+
+def prefetch_member_riddle_ids(members):
+    """
+    Charge les ids d'énigmes de toutes les relations M2M pour une liste de membres,
+    avec une requête par table de liaison (au lieu de 4 requêtes par membre).
+    Les ids sont stockés dans `member._prefetched_riddle_ids` ; les énigmes verrouillées
+    sont déduites en mémoire des énigmes réussies (graphe de dépendances), avec une seule
+    lecture de la version du catalogue pour toute la liste.
+    """
+    from .catalogue import catalogue_version
+
+    members = list(members)
+    if bitset_storage_enabled():
+        # Les ids sont déjà sur la ligne du membre
+        for member in members:
+            member._prefetched_riddle_ids = {
+                relation: member.riddle_bits(relation).ids() for relation in MEMBER_RIDDLE_RELATIONS
+            }
+    else:
+        members_by_pk = {member.pk: member for member in members}
+        for member in members:
+            member._prefetched_riddle_ids = {relation: [] for relation in MEMBER_RIDDLE_RELATIONS}
+
+        if members_by_pk:
+            for relation in MEMBER_RIDDLE_RELATIONS:
+                through = getattr(Member, relation).through
+                rows = through.objects.filter(member_id__in=members_by_pk).values_list('member_id', 'riddle_id')
+                for member_id, riddle_id in rows:
+                    members_by_pk[member_id]._prefetched_riddle_ids[relation].append(riddle_id)
+
+    version = catalogue_version() if members else None
+    for member in members:
+        achieved_ids = set(member._prefetched_riddle_ids['achieved_riddles'])
+        member._prefetched_riddle_ids['locked_riddles'] = sorted(riddle_graph.locked_riddle_ids(achieved_ids, version))
+    return members
+
+class MemberListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        return super().to_representation(prefetch_member_riddle_ids(data.all() if hasattr(data, 'all') else data))
+
 class MemberSerializer(serializers.ModelSerializer):
+    """
+    Pour une liste (many=True), les ids d'énigmes sont préchargés pour toute la page
+    (voir prefetch_member_riddle_ids) ; le queryset devrait aussi faire select_related('user__cv').
+    """
     user = UserSerializer(read_only=True)
     achieved_riddles = serializers.SerializerMethodField()
     locked_riddles = serializers.SerializerMethodField()
@@ -66,6 +125,7 @@ class MemberSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Member
+        list_serializer_class = MemberListSerializer
         fields = [
             'user',
             'member_score',
@@ -77,17 +137,48 @@ class MemberSerializer(serializers.ModelSerializer):
             'have_calculatrice',
         ]
 
+    def _riddle_ids(self, obj, relation):
+        prefetched = getattr(obj, '_prefetched_riddle_ids', None)
+        if prefetched is not None:
+            return prefetched[relation]
+        if bitset_storage_enabled():
+            return obj.riddle_bits(relation).ids()
+        return getattr(obj, relation).values_list('riddle_id', flat=True)
+
     def get_achieved_riddles(self, obj):
-        return obj.achieved_riddles.values_list('riddle_id', flat=True)
+        return self._riddle_ids(obj, 'achieved_riddles')
 
     def get_locked_riddles(self, obj):
-        return obj.locked_riddles.values_list('riddle_id', flat=True)
+        prefetched = getattr(obj, '_prefetched_riddle_ids', None)
+        if prefetched is not None:
+            return prefetched['locked_riddles']
+        return obj.locked_riddle_ids()
 
     def get_achieved_coop_riddles(self, obj):
-        return obj.achieved_coop_riddles.values_list('riddle_id', flat=True)
+        return self._riddle_ids(obj, 'achieved_coop_riddles')
 
     def get_locked_coop_riddles(self, obj):
-        return obj.locked_coop_riddles.values_list('riddle_id', flat=True)
+        return self._riddle_ids(obj, 'locked_coop_riddles')
+
+class MemberLeaderboardSerializer(serializers.ModelSerializer):
+    """
+    Ligne légère du classement global : aucun accès aux M2M ni au CV.
+    Le queryset doit faire select_related('user', 'rank', 'clan').
+    """
+    username = serializers.CharField(source='user.username', read_only=True)
+    profile_picture = serializers.ImageField(source='user.profile_picture', read_only=True)
+    rank_name = serializers.CharField(source='rank.rank_name', read_only=True, default=None)
+    clan_name = serializers.CharField(source='clan.clan_name', read_only=True, default=None)
+
+    class Meta:
+        model = Member
+        fields = [
+            'username',
+            'profile_picture',
+            'member_score',
+            'rank_name',
+            'clan_name',
+        ]
         
 class ClueSerializer(serializers.ModelSerializer):
     class Meta:
@@ -108,7 +199,30 @@ class RiddleDependencySerializer(serializers.ModelSerializer):
             'riddle_points',
         ]
 
+class RiddleSummarySerializer(serializers.ModelSerializer):
+    """
+    Carte d'énigme pour les listes du catalogue : pas de texte, pas d'indices, pas de réponse.
+    Le queryset doit faire prefetch_related('riddle_dependance').
+    """
+    dependance = serializers.PrimaryKeyRelatedField(many=True, read_only=True, source='riddle_dependance')
+
+    class Meta:
+        model = Riddle
+        fields = [
+            'riddle_id',
+            'riddle_type',
+            'riddle_theme',
+            'riddle_difficulty',
+            'riddle_points',
+            'riddle_path',
+            'dependance',
+        ]
+
 class RiddleSerializer(serializers.ModelSerializer):
+    """
+    Document public d'une énigme (détail). `riddle_response` n'est jamais sérialisé :
+    la vérification des réponses se fait côté serveur.
+    """
     clues = ClueSerializer(many=True, read_only=True, source='clue_set')
     dependance = RiddleDependencySerializer(many=True, read_only=True, source='riddle_dependance')
 
@@ -118,7 +232,6 @@ class RiddleSerializer(serializers.ModelSerializer):
             'riddle_id',
             'riddle_type',
             'riddle_variable',
-            'riddle_response',
             'riddle_difficulty',
             'riddle_theme',
             'riddle_points',
@@ -157,6 +270,12 @@ class CoopInvitationSerializer(serializers.ModelSerializer):
         fields = ['id', 'riddle', 'riddle_type', 'inviter', 'inviter_username', 'invitee', 'invitee_username', 'status', 'created_at']
         read_only_fields = ['id', 'status', 'created_at']
 
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'message', 'data', 'created_at', 'read_at']
+        read_only_fields = fields
+
 class RiddleStatsSerializer(serializers.ModelSerializer):
     member_username = serializers.ReadOnlyField(source='member.user.username')
     riddle_name = serializers.ReadOnlyField(source='riddle.riddle_type')
@@ -169,9 +288,17 @@ class RiddleStatsSerializer(serializers.ModelSerializer):
             'riddle',
             'try_count',
             'errors_count',
-            'resolution_count',
-            'first_resolved_at',
-            'is_resolved',
+            'solve_count',
+            'first_solved_at',
+            'is_solved',
             'member_username',
             'riddle_name',
-        ]
\ No newline at end of file
+        ]
+
+
+class RiddleStatsEventSerializer(serializers.Serializer):
+    """Un évènement de statistiques envoyé par le client : essais, erreurs et résolution d'une énigme."""
+    riddle_id = serializers.IntegerField()
+    tries = serializers.IntegerField(min_value=0, default=0)
+    errors = serializers.IntegerField(min_value=0, default=0)
+    solved = serializers.BooleanField(default=False)
\ No newline at end of file
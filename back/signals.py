@@ -1,6 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import User, Member, Riddle, Rank
+from django.db import transaction
+from .models import User, Member, Riddle, Rank, Clan, Clue
+from .riddle_graph import riddle_graph
+from .leaderboard import publish_clan_elo, unpublish_clan
+from .catalogue import bump_catalogue_version
+from .global_stats import record_clans, record_member_removed
+from .authentication import invalidate_cached_user
 
 @receiver(post_save, sender=User)
 def create_member_for_user(sender, instance, created, **kwargs):
@@ -18,6 +24,62 @@ def create_member_for_user(sender, instance, created, **kwargs):
         except Rank.DoesNotExist:
             pass
         
-        # Set all riddles in locked_riddles
-        riddles_to_lock = Riddle.objects.exclude(riddle_id=1) # Exclude the first riddle (id=2)
-        member.locked_riddles.set(riddles_to_lock)
\ No newline at end of file
+        # Les énigmes verrouillées ne sont plus stockées : elles sont déduites du graphe
+        # de dépendances et des énigmes réussies (Member.locked_riddle_ids)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Member)
+def invalidate_cached_user_on_change(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=Riddle.riddle_dependance.through)
+def invalidate_riddle_graph_on_dependency_change(sender, action, **kwargs):
+    # Les autres workers reconstruisent leur graphe au changement de version du catalogue
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        riddle_graph.invalidate()
+
+
+@receiver(post_delete, sender=Riddle)
+def invalidate_riddle_graph_on_riddle_delete(sender, instance, **kwargs):
+    riddle_graph.invalidate()
+
+
+@receiver(post_delete, sender=Member)
+def remove_member_from_clan_aggregates(sender, instance, **kwargs):
+    if instance.clan_id and Clan.objects.filter(pk=instance.clan_id).exists():
+        Clan.apply_aggregates_delta(instance.clan_id, -instance.member_score, -1)
+
+
+@receiver(post_delete, sender=Member)
+def remove_member_from_global_stats(sender, instance, **kwargs):
+    transaction.on_commit(lambda: record_member_removed(instance))
+
+
+@receiver(post_save, sender=Clan)
+def add_clan_to_leaderboard(sender, instance, created, **kwargs):
+    if created:
+        publish_clan_elo(instance.clan_id, instance.clan_elo)
+        transaction.on_commit(lambda: record_clans(1))
+
+
+@receiver(post_delete, sender=Clan)
+def remove_clan_from_leaderboard(sender, instance, **kwargs):
+    unpublish_clan(instance.clan_id)
+    transaction.on_commit(lambda: record_clans(-1))
+
+
+@receiver(post_save, sender=Riddle)
+@receiver(post_delete, sender=Riddle)
+@receiver(post_save, sender=Clue)
+@receiver(post_delete, sender=Clue)
+def invalidate_catalogue_on_change(sender, **kwargs):
+    bump_catalogue_version()
+
+
+@receiver(m2m_changed, sender=Riddle.riddle_dependance.through)
+def invalidate_catalogue_on_dependency_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalogue_version()
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import F
+from .models import Clan, Clue, Member, Rank
+from .bitsets import RiddleBitset, bitset_storage_enabled, bits_field_name
+from .riddle_graph import riddle_graph, invalidate_locked_riddles
+from .global_stats import record_solve
+from .authentication import invalidate_cached_user
+
+
+# Pourcentage des points accordés selon le nombre d'indices révélés
+CLUE_PERCENTAGES = {
+    0: 1.0,
+    1: 0.75,
+    2: 0.5,
+    3: 0.25,
+}
+
+
+def clue_percentage(revealed_clues_count):
+    """Calculate the percentage of points to add depending on the number of revealed clues."""
+    return CLUE_PERCENTAGES.get(revealed_clues_count, 1.0)
+
+
+def _solve(member, riddle, achieved_field, locked_field, score_field, update_rank, count_theme=False):
+    """
+    Pipeline de résolution commun au solo et à la coop.
+
+    Tout se fait dans une seule transaction, avec la ligne du membre verrouillée
+    (`select_for_update`) : deux soumissions simultanées de la même réponse sont
+    sérialisées et la seconde voit l'énigme déjà résolue. Le nombre de requêtes
+    est fixe, quelle que soit la taille du catalogue ou du clan.
+    En stockage 'bitset', l'état du membre est lu sur la ligne verrouillée et réécrit
+    par l'UPDATE du score.
+    Sans `locked_field` (solo), les énigmes verrouillées ne sont pas stockées mais déduites
+    du graphe : on invalide seulement leur mémorisation.
+    Avec `count_theme`, l'histogramme des thèmes du membre est incrémenté par le même UPDATE.
+
+    Retourne True si l'énigme vient d'être résolue, False si elle l'était déjà.
+    """
+    achieved_relation = achieved_field.field.name
+    locked_relation = locked_field.field.name if locked_field else None
+    updates = {}
+
+    with transaction.atomic():
+        if bitset_storage_enabled():
+            locked_member = Member.objects.select_for_update().get(pk=member.pk)
+
+            achieved = locked_member.riddle_bits(achieved_relation)
+            if riddle.riddle_id in achieved:
+                return False
+            achieved.add(riddle.riddle_id)
+
+            riddle_clues = RiddleBitset(Clue.objects.filter(riddle_id=riddle.riddle_id).values_list('clue_id', flat=True))
+            revealed_clues_count = len(locked_member.riddle_bits('revealed_clues') & riddle_clues)
+
+            # Les bitmaps sont écrits par le même UPDATE que le score
+            updates[bits_field_name(achieved_relation)] = achieved.to_bytes()
+            if locked_relation:
+                locked = locked_member.riddle_bits(locked_relation) - RiddleBitset(riddle_graph.dependents_of(riddle.riddle_id))
+                updates[bits_field_name(locked_relation)] = locked.to_bytes()
+        else:
+            locked_member = (
+                Member.objects.select_for_update()
+                .only('user_id', score_field, 'rank_id', 'clan_id', 'theme_histogram')
+                .get(pk=member.pk)
+            )
+            achieved_through = achieved_field.through
+
+            if achieved_through.objects.filter(member_id=member.pk, riddle_id=riddle.riddle_id).exists():
+                return False
+
+            achieved_through.objects.create(member_id=member.pk, riddle_id=riddle.riddle_id)
+            if locked_field:
+                locked_member.unlock_dependent_riddles(riddle, locked_field)
+
+            revealed_clues_count = locked_member.revealed_clues.filter(riddle_id=riddle.riddle_id).count()
+
+        points = riddle.riddle_points * clue_percentage(revealed_clues_count)
+
+        updates[score_field] = F(score_field) + points
+        if count_theme and locked_member.theme_histogram is not None:
+            # La ligne du membre est verrouillée : lecture-modification-écriture sans perte de mise à jour.
+            # Un histogramme pas encore calculé (None) le sera en entier à sa première lecture.
+            histogram = dict(locked_member.theme_histogram)
+            histogram[riddle.riddle_theme] = histogram.get(riddle.riddle_theme, 0) + 1
+            updates['theme_histogram'] = histogram
+        if update_rank:
+            new_score = getattr(locked_member, score_field) + points
+            new_rank_id = (
+                Rank.objects.filter(min_score__lte=new_score)
+                .order_by('-min_score')  # tri descendant
+                .values_list('rank_id', flat=True)
+                .first()
+            )
+            if new_rank_id is not None:
+                updates['rank_id'] = new_rank_id
+        Member.objects.filter(pk=member.pk).update(**updates)
+
+        if update_rank and locked_member.clan_id:
+            Clan.apply_aggregates_delta(locked_member.clan_id, score_delta=points)
+
+        if not locked_field:
+            # Les énigmes verrouillées sont déduites des énigmes réussies
+            transaction.on_commit(lambda: invalidate_locked_riddles(member.pk))
+        if score_field == 'member_score':
+            transaction.on_commit(lambda: record_solve(points))
+        # Score et rang du membre mis en cache par l'authentification
+        transaction.on_commit(lambda: invalidate_cached_user(member.pk))
+
+    return True
+
+
+def solve_riddle(member, riddle):
+    """Marque une énigme solo comme résolue, met à jour le score, le rang et l'élo du clan."""
+    return _solve(member, riddle, Member.achieved_riddles, None, 'member_score', update_rank=True, count_theme=True)
+
+
+def solve_coop_riddle(member, riddle):
+    """Marque une énigme coop comme résolue et met à jour le score de clan du membre."""
+    return _solve(member, riddle, Member.achieved_coop_riddles, Member.locked_coop_riddles, 'member_clan_score', update_rank=False)
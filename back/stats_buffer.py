@@ -0,0 +1,310 @@
+import logging
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from django.conf import settings
+from django.db import connection, transaction
+from .models import Member, MemberRiddleStats, Riddle
+
+logger = logging.getLogger('custom_logger')
+
+COUNTERS = ('try_count', 'errors_count', 'solve_count')
+
+
+############################################################################################################################
+# region Bulk upsert
+
+def upsert_riddle_stats(rows, batch_size=500):
+    """
+    Applique des incréments de statistiques en INSERT ... ON CONFLICT DO UPDATE
+    (une requête par lot) : les compteurs sont additionnés côté base, sans lecture préalable.
+
+    `rows` : itérable de dicts {member_id, riddle_id, try_count, errors_count, solve_count, first_solved_at}.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    quote = connection.ops.quote_name
+    table = quote(MemberRiddleStats._meta.db_table)
+    columns = ['member_id', 'riddle_id', *COUNTERS, 'first_solved_at', 'is_solved']
+    column = {name: quote(MemberRiddleStats._meta.get_field(name.removesuffix('_id')).column) for name in columns}
+    counters_sql = ', '.join(f"{column[name]} = {table}.{column[name]} + EXCLUDED.{column[name]}" for name in COUNTERS)
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(batch))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(column[name] for name in columns)}) VALUES {placeholders} "
+            f"ON CONFLICT ({column['member_id']}, {column['riddle_id']}) DO UPDATE SET {counters_sql}, "
+            f"{column['first_solved_at']} = COALESCE({table}.{column['first_solved_at']}, EXCLUDED.{column['first_solved_at']}), "
+            f"{column['is_solved']} = {table}.{column['is_solved']} OR EXCLUDED.{column['is_solved']}"
+        )
+        params = []
+        for row in batch:
+            first_solved_at = row.get('first_solved_at')
+            params += [
+                row['member_id'],
+                row['riddle_id'],
+                row.get('try_count', 0),
+                row.get('errors_count', 0),
+                row.get('solve_count', 0),
+                first_solved_at,
+                first_solved_at is not None,
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    return len(rows)
+
+# endregion
+############################################################################################################################
+# region Backends
+
+
+def _empty_delta():
+    return {'try_count': 0, 'errors_count': 0, 'solve_count': 0, 'first_solved_at': None}
+
+
+class InMemoryStatsBackend:
+    """Tampon local au processus (tests, développement)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._committing = {}
+
+    def add(self, member_id, riddle_id, increments, solved_at):
+        with self._lock:
+            delta = self._pending.setdefault((member_id, riddle_id), _empty_delta())
+            for name, value in increments.items():
+                delta[name] += value
+            if solved_at is not None and delta['first_solved_at'] is None:
+                delta['first_solved_at'] = solved_at
+
+    def pending(self, member_id, riddle_id):
+        with self._lock:
+            total = _empty_delta()
+            for buffer in (self._flushing, self._pending):
+                delta = buffer.get((member_id, riddle_id))
+                if delta:
+                    for name in COUNTERS:
+                        total[name] += delta[name]
+                    total['first_solved_at'] = total['first_solved_at'] or delta['first_solved_at']
+            return total
+
+    def begin_flush(self):
+        with self._lock:
+            if self._flushing or not self._pending:
+                return None
+            self._flushing, self._pending = self._pending, {}
+            return dict(self._flushing)
+
+    def commit_flush(self):
+        with self._lock:
+            self._committing, self._flushing = self._flushing, {}
+
+    def end_flush(self, success):
+        with self._lock:
+            if not success:
+                # On remet les incréments non appliqués dans le tampon
+                for key, delta in {**self._flushing, **self._committing}.items():
+                    self._add_delta(key, delta)
+            self._flushing = {}
+            self._committing = {}
+
+    def _add_delta(self, key, delta):
+        target = self._pending.setdefault(key, _empty_delta())
+        for name in COUNTERS:
+            target[name] += delta[name]
+        target['first_solved_at'] = delta['first_solved_at'] or target['first_solved_at']
+
+
+class SynchronousStatsBackend:
+    """
+    Écriture différée désactivée (BACKEND 'none') : chaque incrément est appliqué
+    immédiatement par les mises à jour F() de MemberRiddleStats.
+    """
+
+    def add(self, member_id, riddle_id, increments, solved_at):
+        stats, _ = MemberRiddleStats.objects.get_or_create(member_id=member_id, riddle_id=riddle_id)
+        if increments.get('solve_count'):
+            stats.mark_solved()
+        for name in ('try_count', 'errors_count'):
+            if increments.get(name):
+                stats.increment(name, increments[name])
+
+    def pending(self, member_id, riddle_id):
+        return _empty_delta()
+
+    def begin_flush(self):
+        return None
+
+    def commit_flush(self):
+        pass
+
+    def end_flush(self, success):
+        pass
+
+
+class RedisStatsBackend:
+    """
+    Tampon partagé entre les workers : un hash Redis `<prefix>:pending` incrémenté par HINCRBY.
+    Le flush renomme atomiquement ce hash en `<prefix>:flushing`, conservé tant qu'il n'a pas été
+    écrit en base (un verrou `<prefix>:flush_lock` garantit un seul flush à la fois).
+    Juste avant le commit, `flushing` devient `<prefix>:committing`, que les lectures ignorent :
+    les incréments ne sont jamais comptés à la fois dans Redis et en base.
+    """
+
+    def __init__(self, url, prefix):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._pending_key = f"{prefix}:pending"
+        self._flushing_key = f"{prefix}:flushing"
+        self._committing_key = f"{prefix}:committing"
+        self._lock_key = f"{prefix}:flush_lock"
+
+    def add(self, member_id, riddle_id, increments, solved_at):
+        pipe = self._client.pipeline(transaction=False)
+        for name, value in increments.items():
+            if value:
+                pipe.hincrby(self._pending_key, f"{member_id}:{riddle_id}:{name}", value)
+        if solved_at is not None:
+            pipe.hsetnx(self._pending_key, f"{member_id}:{riddle_id}:first_solved_at", solved_at.timestamp())
+        pipe.execute()
+
+    def pending(self, member_id, riddle_id):
+        fields = [f"{member_id}:{riddle_id}:{name}" for name in (*COUNTERS, 'first_solved_at')]
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hmget(self._flushing_key, fields)
+        pipe.hmget(self._pending_key, fields)
+        total = _empty_delta()
+        for values in pipe.execute():
+            for name, value in zip(COUNTERS, values):
+                total[name] += int(value or 0)
+            if values[-1] is not None and total['first_solved_at'] is None:
+                total['first_solved_at'] = datetime.fromtimestamp(float(values[-1]), tz=timezone.utc)
+        return total
+
+    def begin_flush(self):
+        import redis
+
+        # Un seul flush à la fois entre les workers
+        if not self._client.set(self._lock_key, 1, nx=True, ex=60):
+            return None
+        if not self._client.exists(self._flushing_key):
+            # Sinon, le hash `flushing` d'un flush précédent en échec est rejoué
+            try:
+                self._client.rename(self._pending_key, self._flushing_key)
+            except redis.ResponseError:
+                self._client.delete(self._lock_key)
+                return None  # Rien en attente
+
+        deltas = {}
+        for field, value in self._client.hgetall(self._flushing_key).items():
+            member_id, riddle_id, name = field.decode().split(':')
+            delta = deltas.setdefault((int(member_id), int(riddle_id)), _empty_delta())
+            if name == 'first_solved_at':
+                delta[name] = datetime.fromtimestamp(float(value), tz=timezone.utc)
+            else:
+                delta[name] += int(value)
+        return deltas
+
+    def commit_flush(self):
+        self._client.rename(self._flushing_key, self._committing_key)
+
+    def end_flush(self, success):
+        if success:
+            self._client.delete(self._committing_key)
+        elif self._client.exists(self._committing_key):
+            # Commit en échec : les incréments seront rejoués au prochain flush
+            self._client.rename(self._committing_key, self._flushing_key)
+        self._client.delete(self._lock_key)
+
+
+# endregion
+############################################################################################################################
+# region Buffer
+
+
+class RiddleStatsBuffer:
+    """
+    Tampon d'écriture différée des compteurs MemberRiddleStats (essais, erreurs, résolutions).
+    Les incréments sont cumulés par (membre, énigme) puis appliqués en masse par `flush()`
+    (commande flush_riddle_stats). Avec `flush_interval` (backend 'memory', local au processus),
+    le flush est aussi déclenché par les requêtes toutes les `flush_interval` secondes.
+    """
+
+    def __init__(self, backend, flush_interval=None):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def record(self, member_id, riddle_id, tries=0, errors=0, solves=0, solved_at=None):
+        increments = {'try_count': tries, 'errors_count': errors, 'solve_count': solves}
+        self.backend.add(member_id, riddle_id, increments, solved_at)
+        if self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def pending(self, member_id, riddle_id):
+        return self.backend.pending(member_id, riddle_id)
+
+    def merge_pending(self, stats):
+        """Ajoute à une instance MemberRiddleStats (éventuellement non sauvegardée) les incréments non encore écrits."""
+        delta = self.pending(stats.member_id, stats.riddle_id)
+        for name in COUNTERS:
+            setattr(stats, name, getattr(stats, name) + delta[name])
+        if delta['first_solved_at'] and not stats.first_solved_at:
+            stats.first_solved_at = delta['first_solved_at']
+        stats.is_solved = stats.is_solved or delta['first_solved_at'] is not None
+        return stats
+
+    def flush(self):
+        """Écrit les incréments en attente ; retourne le nombre de lignes (membre, énigme) mises à jour."""
+        self._last_flush = time.monotonic()
+        deltas = self.backend.begin_flush()
+        if deltas is None:
+            return 0
+
+        try:
+            with transaction.atomic():
+                # Ignore les incréments d'un membre ou d'une énigme supprimés entre-temps
+                member_ids = set(Member.objects.filter(pk__in={key[0] for key in deltas}).values_list('pk', flat=True))
+                riddle_ids = set(Riddle.objects.filter(pk__in={key[1] for key in deltas}).values_list('pk', flat=True))
+                count = upsert_riddle_stats(
+                    {'member_id': member_id, 'riddle_id': riddle_id, **delta}
+                    for (member_id, riddle_id), delta in deltas.items()
+                    if member_id in member_ids and riddle_id in riddle_ids
+                )
+                # Dans la transaction : les lectures cessent de compter ces incréments avant le commit
+                self.backend.commit_flush()
+        except Exception:
+            logger.error("Échec du flush des statistiques d'énigmes", exc_info=True)
+            self.backend.end_flush(success=False)
+            return 0
+        self.backend.end_flush(success=True)
+        return count
+
+
+_riddle_stats_buffer = None
+_riddle_stats_buffer_lock = Lock()
+
+
+def riddle_stats_buffer():
+    global _riddle_stats_buffer
+    if _riddle_stats_buffer is None:
+        with _riddle_stats_buffer_lock:
+            if _riddle_stats_buffer is None:
+                config = settings.RIDDLE_STATS_BUFFER
+                if config['BACKEND'] == 'redis':
+                    backend = RedisStatsBackend(config['URL'], config['KEY_PREFIX'])
+                elif config['BACKEND'] == 'none':
+                    backend = SynchronousStatsBackend()
+                else:
+                    backend = InMemoryStatsBackend()
+                # Les backends partagés sont vidés par le worker flush_riddle_stats, pas par les requêtes
+                flush_interval = config['FLUSH_INTERVAL'] if isinstance(backend, InMemoryStatsBackend) else None
+                _riddle_stats_buffer = RiddleStatsBuffer(backend, flush_interval)
+    return _riddle_stats_buffer
+
+# endregion
@@ -1,3 +1,159 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .models import User, Riddle, Member, MemberRiddleStats
 
-# Create your tests here.
+
+@override_settings(MEMBER_STATE_STORAGE='m2m')
+class MemberListQueryCountTests(TestCase):
+    """La liste des membres coûte un nombre fixe de requêtes, quel que soit le nombre de membres."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.riddles = [
+            Riddle.objects.create(
+                riddle_type=f"type_{i}", riddle_variable="", riddle_response={}, riddle_difficulty=1,
+                riddle_theme="theme", riddle_points=10, riddle_mode="solo",
+            )
+            for i in range(3)
+        ]
+        cls.viewer = cls.create_members(1)[0]
+
+    @classmethod
+    def create_members(cls, count):
+        start = User.objects.count()
+        users = []
+        for i in range(start, start + count):
+            user = User.objects.create_user(f"member_{i}", f"member_{i}@example.com", "password")
+            user.member.achieved_riddles.add(cls.riddles[i % len(cls.riddles)])
+            user.member.achieved_coop_riddles.add(cls.riddles[0])
+            users.append(user)
+        return users
+
+    def list_members(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        response = client.get('/api/members/all/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_member_view_query_count_is_constant(self):
+        self.create_members(2)
+        self.list_members()  # Graphe de dépendances et catalogue chargés
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.list_members()), 3)
+
+        self.create_members(7)
+        with self.assertNumQueries(len(queries)):
+            members = self.list_members()
+        self.assertEqual(len(members), 10)
+        self.assertTrue(all(member['achieved_riddles'] for member in members))
+
+
+# La base SQLite de test (mémoire partagée) lève "table is locked" au lieu d'attendre le verrou
+@skipIf(connection.vendor == 'sqlite', "Écritures concurrentes : nécessite PostgreSQL")
+class AtomicCounterConcurrencyTests(TransactionTestCase):
+    """Les compteurs de MemberRiddleStats ne perdent aucune mise à jour sous écritures concurrentes."""
+    workers = 8
+    rounds = 25
+
+    def setUp(self):
+        user = User.objects.create_user("player", "player@example.com", "password")
+        riddle = Riddle.objects.create(
+            riddle_type="type", riddle_variable="", riddle_response={}, riddle_difficulty=1,
+            riddle_theme="theme", riddle_points=10, riddle_mode="solo",
+        )
+        self.stats = MemberRiddleStats.objects.create(member=user.member, riddle=riddle)
+
+    def run_concurrently(self, action):
+        def work(_):
+            try:
+                # Chaque thread a sa propre instance (et sa connexion), donc des valeurs lues périmées
+                stats = MemberRiddleStats.objects.get(pk=self.stats.pk)
+                for _ in range(self.rounds):
+                    action(stats)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(work, range(self.workers)))
+        self.stats.refresh_from_db()
+
+    def test_concurrent_increments_are_not_lost(self):
+        self.run_concurrently(MemberRiddleStats.increment_tries)
+        self.assertEqual(self.stats.try_count, self.workers * self.rounds)
+
+    def test_concurrent_mark_solved(self):
+        self.run_concurrently(MemberRiddleStats.mark_solved)
+        self.assertEqual(self.stats.solve_count, self.workers * self.rounds)
+        self.assertTrue(self.stats.is_solved)
+        self.assertIsNotNone(self.stats.first_solved_at)
+
+
+class MemberLeaderboardLimitTests(TestCase):
+    """Une taille de page nulle ou négative est refusée (400) au lieu de provoquer une erreur serveur."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("leader", "leader@example.com", "password")
+
+    def get_leaderboard(self, limit):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get('/api/members/leaderboard/', {'limit': limit})
+
+    def test_zero_limit_is_rejected(self):
+        self.assertEqual(self.get_leaderboard(0).status_code, 400)
+
+    def test_negative_limit_is_rejected(self):
+        self.assertEqual(self.get_leaderboard(-3).status_code, 400)
+
+    def test_positive_limit(self):
+        response = self.get_leaderboard(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class RiddleStatsBodyTests(TestCase):
+    """Un corps mal formé ou vide est refusé (400) au lieu de provoquer une erreur serveur."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("player", "player@example.com", "password")
+        cls.riddle = Riddle.objects.create(
+            riddle_type="type", riddle_variable="", riddle_response={}, riddle_difficulty=1,
+            riddle_theme="theme", riddle_points=10, riddle_mode="solo",
+        )
+
+    def post_stats(self, body):
+        return APIClient().post('/api/riddles/stats/', body, format='json')
+
+    def test_list_body_is_rejected(self):
+        response = self.post_stats([{"riddle_id": self.riddle.pk, "tries": 1}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_body_is_rejected(self):
+        self.assertEqual(self.post_stats({}).status_code, 400)
+
+    def test_empty_events_are_rejected(self):
+        self.assertEqual(self.post_stats({"member_name": "player", "events": []}).status_code, 400)
+
+    def test_events_must_be_a_list(self):
+        response = self.post_stats({"member_name": "player", "events": {"riddle_id": self.riddle.pk}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_is_applied(self):
+        response = self.post_stats({
+            "member_name": "player",
+            "events": [
+                {"riddle_id": self.riddle.pk, "tries": 2, "errors": 1},
+                {"riddle_id": self.riddle.pk, "tries": 1, "solved": True},
+            ],
+        })
+        self.assertEqual(response.status_code, 201)
+        stats = MemberRiddleStats.objects.get(member_id=self.user.pk, riddle=self.riddle)
+        self.assertEqual((stats.try_count, stats.errors_count, stats.solve_count), (3, 1, 1))
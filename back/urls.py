@@ -26,6 +26,8 @@ from .views import (
     CoopConnectedMembersView,
     InviteMemberToCoopView,
     FetchReceivedInvitationsView,
+    NotificationListView,
+    MarkNotificationsReadView,
     UpdateBioView,
     PasswordResetView,
     PasswordResetConfirmView,
@@ -35,6 +37,7 @@ from .views import (
     CheckRiddleStatsView,
     GetRiddleStatsView,
     MemberView,
+    MemberLeaderboardView,
     UsersWithCVListView,
     GlobalClanStatsView
 )
@@ -49,6 +52,7 @@ urlpatterns = [
     path('api/users/cv/', UsersWithCVListView.as_view(), name='users-with-cv'),
     path('api/members/', MemberDetailView.as_view(), name='member-detail'),
     path('api/members/all/', MemberView.as_view(), name='member-view'),
+    path('api/members/leaderboard/', MemberLeaderboardView.as_view(), name='member-leaderboard'),
     path('api/members/update-bio/', UpdateBioView.as_view(), name='update_bio'),
     path('api/members/<str:username>/riddles/', MemberRiddlesView.as_view(), name='member-riddles'),
     path('api/members/<str:username>/riddles/coop/', MemberCoopRiddlesView.as_view(), name='member-coop-riddles'),
@@ -67,6 +71,8 @@ urlpatterns = [
     path('api/clans/stats/', GlobalClanStatsView.as_view(), name='global-clan-stats'),
     path('api/clans/invitations/received/', FetchReceivedInvitationsView.as_view(), name='fetch-received-invitations'),
     path('api/coop/invitations/<int:invitation_id>/respond/', RespondCoopInvitationView.as_view(), name='respond-coop-invitation'),
+    path('api/notifications/', NotificationListView.as_view(), name='notifications'),
+    path('api/notifications/read/', MarkNotificationsReadView.as_view(), name='notifications-read'),
     path('api/coop/members/<int:riddle_id>/', CoopConnectedMembersView.as_view(), name='coop-connected-members'),
     path('api/riddles/clue/', GetClue.as_view(), name='get-clue'),
     path('api/clans/', ClanListView.as_view(), name='clan-list'),
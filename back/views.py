@@ -7,22 +7,34 @@ from rest_framework.generics import RetrieveAPIView
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.contrib.auth.hashers import make_password
-from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import default_token_generator
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.shortcuts import redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_str, force_bytes
-from django.db.models import Count
-from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import Q
 from django.utils.timezone import now
-from channels.layers import get_channel_layer
-from .serializers import UserDetailSerializer, UserUpdateSerializer, RiddleSerializer, MemberSerializer, SimpleRiddleSerializer, ClanSerializer, CVSerializer, CoopInvitationSerializer, RiddleStatsSerializer, UserSerializer
-from .models import User, Riddle, Member, Clue, Clan, CV, CoopInvitation, MemberRiddleStats
+from .serializers import UserDetailSerializer, UserUpdateSerializer, MemberSerializer, SimpleRiddleSerializer, ClanSerializer, CVSerializer, CoopInvitationSerializer, RiddleStatsSerializer, RiddleStatsEventSerializer, UserSerializer, MemberLeaderboardSerializer, NotificationSerializer
+from .models import User, Riddle, Member, Clue, Clan, CV, CoopInvitation, MemberRiddleStats, OutboundEmail, Notification
+from .solving import solve_riddle, solve_coop_riddle
+from .checkers import verify_answer, answer_index
+from .stats_buffer import riddle_stats_buffer, upsert_riddle_stats
+from .global_stats import global_stats
+from .login import login_engine, LoginThrottled, LoginUnavailable
+from .presence import coop_presence
+from .notifications import notify, mark_read, INBOX_DELIVERY_LIMIT
+from .events import publish
+from .leaderboard import clan_leaderboard
+from .catalogue import catalogue_version, catalogue_etag, get_payload, build_riddle_list, build_riddle_detail
 import requests
+import json
 
 
 class SignUpView(APIView):
@@ -37,24 +49,25 @@ class SignUpView(APIView):
             except ValidationError:
                 return Response({'error': 'Format d\'email invalide'}, status=status.HTTP_400_BAD_REQUEST)
             
-            user = User.objects.create(
-                username=data['username'],
-                email=email,
-                password=make_password(data['password']),
-                is_active=False
-            )
-            
-
-            token = default_token_generator.make_token(user)
-            activation_link = f"{settings.BACKEND_URL}/activate/{user.id}/{token}"
-
-            send_mail(
-                subject='Activate Your Account',
-                message=f"Hi {user.username},\n\nClick the link below to activate your account:\n{activation_link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[data['email']],
-                fail_silently=False,
-            )
+            # L'utilisateur et l'e-mail d'activation sont écrits ensemble ; l'envoi SMTP
+            # est fait hors requête par la commande send_outbox_emails
+            with transaction.atomic():
+                user = User.objects.create(
+                    username=data['username'],
+                    email=email,
+                    password=make_password(data['password']),
+                    is_active=False
+                )
+
+                token = default_token_generator.make_token(user)
+                activation_link = f"{settings.BACKEND_URL}/activate/{user.id}/{token}"
+
+                OutboundEmail.enqueue(
+                    subject='Activate Your Account',
+                    message=f"Hi {user.username},\n\nClick the link below to activate your account:\n{activation_link}",
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[data['email']],
+                )
 
             return Response({'message': 'Utilisateur crée! Redirection...'}, status=status.HTTP_201_CREATED)
         except Exception as e:
@@ -77,30 +90,46 @@ class ActivateAccountView(APIView):
             # Rediriger vers une page d'erreur front-end
             return Response({'error': 'Erreur de vérification'}, status=status.HTTP_400_BAD_REQUEST)
         
-class LogInView(APIView):
-    def post(self, request):
-        data = request.data
+@method_decorator(csrf_exempt, name='dispatch')
+class LogInView(View):
+    """
+    Connexion : identifiants vérifiés par le moteur de back/login.py (limitation de débit,
+    une seule lecture de l'utilisateur, hash dans un pool borné). Vue asynchrone (et non APIView) :
+    sous daphne, la requête attend le hash sans occuper de thread du worker ASGI.
+    Un nom d'utilisateur inconnu et un mauvais mot de passe donnent la même réponse.
+    """
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or '{}') if request.content_type == 'application/json' else request.POST
+        except ValueError:
+            return JsonResponse({'error': 'Requête invalide.'}, status=status.HTTP_400_BAD_REQUEST)
         username = data.get('username')
         password = data.get('password')
 
-        user = User.objects.get(username=username)
+        try:
+            user = await login_engine().authenticate(request, username, password)
+        except LoginThrottled as e:
+            response = JsonResponse({'error': 'Trop de tentatives de connexion. Réessayez plus tard.'},
+                                    status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(int(e.retry_after) + 1)
+            return response
+        except LoginUnavailable:
+            return JsonResponse({'error': 'Service momentanément indisponible. Réessayez plus tard.'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if user is None:
+            return JsonResponse({'error': 'Nom d\'utilisateur ou mot de passe incorrect'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        if user is not None:
-            if not user.is_active:
-                return Response({'error': 'Votre compte n\'est pas actif. Veuillez vérifer votre adresse email pour l\'activer.'},
+        if not user.is_active:
+            return JsonResponse({'error': 'Votre compte n\'est pas actif. Veuillez vérifer votre adresse email pour l\'activer.'},
                                 status=status.HTTP_403_FORBIDDEN)
-            
-            # Authentifier l'utilisateur
-            user = authenticate(username=username, password=password)
-
-            refresh = RefreshToken.for_user(user) # Generate authentification token
-            return Response({
-                'message': 'Connexion réussie! Redirection...',
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }, status=status.HTTP_200_OK)
-        else:
-            return Response({'error': 'Nom d\'utilisateur ou mot de passe incorrect'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        refresh = RefreshToken.for_user(user) # Generate authentification token
+        return JsonResponse({
+            'message': 'Connexion réussie! Redirection...',
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }, status=status.HTTP_200_OK)
         
 class PasswordResetView(APIView):
     def post(self, request):
@@ -130,13 +159,12 @@ class PasswordResetView(APIView):
         # Créer le lien de réinitialisation
         reset_link = f"{settings.FRONTEND_URL}/reset_password?uid={uid}&token={token}"
 
-        # Envoyer l'e-mail
-        send_mail(
+        # Mettre l'e-mail en file d'envoi (commande send_outbox_emails)
+        OutboundEmail.enqueue(
             subject='Réinitialisation de votre mot de passe',
             message=f"Bonjour {user.username},\n\nCliquez sur le lien suivant pour réinitialiser votre mot de passe :\n{reset_link}\n\nSi vous n'avez pas demandé cette réinitialisation, veuillez ignorer cet e-mail.",
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
-            fail_silently=False,
         )
 
         return Response({'message': 'Un e-mail de réinitialisation a été envoyé.'}, status=status.HTTP_200_OK)
@@ -203,10 +231,61 @@ class MemberView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        members = Member.objects.all().order_by('-member_score')
+        members = Member.objects.select_related('user__cv').order_by('-member_score')
         serializer = MemberSerializer(members, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class MemberLeaderboardView(APIView):
+    """
+    Classement global des membres, paginé par curseur (score, user_id).
+    - ?limit= : taille de page (50 par défaut, 100 max)
+    - ?cursor= : valeur `next_cursor` de la page précédente
+    Une seule requête par page grâce à l'index member_score_idx et au select_related.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 50
+    max_limit = 100
+
+    @staticmethod
+    def encode_cursor(member):
+        return urlsafe_base64_encode(force_bytes(f"{member.member_score!r}:{member.user_id}"))
+
+    @staticmethod
+    def decode_cursor(cursor):
+        score, user_id = force_str(urlsafe_base64_decode(cursor)).split(':')
+        return float(score), int(user_id)
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit doit être un entier."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0:
+            return Response({"error": "limit doit être strictement positif."}, status=status.HTTP_400_BAD_REQUEST)
+
+        members = (
+            Member.objects.select_related('user', 'rank', 'clan')
+            .only('member_score', 'user__username', 'user__profile_picture', 'rank__rank_name', 'clan__clan_name')
+            .order_by('-member_score', 'user_id')
+        )
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                score, user_id = self.decode_cursor(cursor)
+            except (ValueError, TypeError):
+                return Response({"error": "Curseur invalide."}, status=status.HTTP_400_BAD_REQUEST)
+            members = members.filter(Q(member_score__lt=score) | Q(member_score=score, user_id__gt=user_id))
+
+        page = list(members[:limit + 1])
+        has_next = len(page) > limit
+        page = page[:limit]
+
+        return Response({
+            "results": MemberLeaderboardSerializer(page, many=True).data,
+            "next_cursor": self.encode_cursor(page[-1]) if has_next else None,
+        }, status=status.HTTP_200_OK)
+
 class MemberDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -223,7 +302,7 @@ class MemberRiddlesView(APIView):
         member = get_object_or_404(Member, user=user)
 
         achieved_riddles = SimpleRiddleSerializer(member.achieved_riddles.all(), many=True).data
-        locked_riddles = SimpleRiddleSerializer(member.locked_riddles.all(), many=True).data
+        locked_riddles = SimpleRiddleSerializer(Riddle.objects.filter(riddle_id__in=member.locked_riddle_ids()), many=True).data
 
         return Response({
             "achievedRiddles": achieved_riddles,
@@ -245,76 +324,130 @@ class MemberCoopRiddlesView(APIView):
             "lockedCoopRiddles": locked_coop_riddles
         })
     
-class SoloRiddleListView(generics.ListAPIView):
+class CatalogueView(APIView):
+    """
+    Base des vues du catalogue : réponses JSON pré-sérialisées, mises en cache par version
+    du catalogue (voir back/catalogue.py), avec ETag / If-None-Match.
     """
-    Vue pour lister toutes les énigmes.
+    permission_classes = [IsAuthenticated]
+
+    def catalogue_response(self, request, name, build):
+        version = catalogue_version()
+        etag = catalogue_etag(version, name)
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            payload = get_payload(version, name, build)
+            if payload is None:
+                return Response({'error': 'Riddle not found'}, status=status.HTTP_404_NOT_FOUND)
+            response = HttpResponse(payload, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+class SoloRiddleListView(CatalogueView):
+    """
+    Vue pour lister toutes les énigmes (cartes résumées, voir RiddleSummarySerializer).
+    Le détail s'obtient via RiddleDetailView.
     """
-    queryset = Riddle.objects.filter(riddle_mode='solo')
-    serializer_class = RiddleSerializer
-    permission_classes = [IsAuthenticated] 
+    def get(self, request):
+        return self.catalogue_response(request, 'summary:solo', lambda: build_riddle_list('solo'))
 
-class CoopRiddleListView(generics.ListAPIView):
+class CoopRiddleListView(CatalogueView):
     """
-    Vue pour lister toutes les énigmes.
+    Vue pour lister toutes les énigmes coop (cartes résumées, voir RiddleSummarySerializer).
     """
-    queryset = Riddle.objects.filter(riddle_mode='coop')
-    serializer_class = RiddleSerializer
-    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        return self.catalogue_response(request, 'summary:coop', lambda: build_riddle_list('coop'))
 
-class RiddleDetailView(generics.RetrieveAPIView):
+class RiddleDetailView(CatalogueView):
     """
     Vue pour récupérer les détails d'une énigme spécifique.
     """
-    queryset = Riddle.objects.all()
-    serializer_class = RiddleSerializer
-    permission_classes = [IsAuthenticated]
-    lookup_field = 'riddle_id'
+    def get(self, request, riddle_id):
+        return self.catalogue_response(request, f'detail:{riddle_id}', lambda: build_riddle_detail(riddle_id))
 
 class RiddleStatsView(APIView):
     """
-    Vue pour créer ou mettre à jour les statistiques d'une énigme pour un membre.
+    Vue pour enregistrer en une fois les statistiques d'une session de jeu d'un membre.
+    Corps : {"member_name": ..., "events": [{"riddle_id", "tries", "errors", "solved"}, ...]}
+    (un évènement unique {"riddle_id", "try_count", "errors_count", "is_resolved"} reste accepté).
+    Les évènements sont validés contre l'index des énigmes et appliqués en un seul upsert.
     """
 
     def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"error": "Le corps doit être un objet JSON {\"member_name\", \"events\"}."},
+                            status=status.HTTP_400_BAD_REQUEST)
         member_name = request.data.get('member_name')
-        riddle_id = request.data.get('riddle_id')
-        errors_count = request.data.get('errors_count', 0)
-        is_resolved = request.data.get('is_resolved', False)
-        try_count = request.data.get('try_count', 1)
-
-        # Valider les objets Member et Riddle
-        member = get_object_or_404(Member, user__username=member_name)
-        riddle = get_object_or_404(Riddle, riddle_id=riddle_id)
-
-        # Récupérer ou créer une statistique
-        riddle_stats, created = MemberRiddleStats.objects.get_or_create(
-            member=member,
-            riddle=riddle,
-            defaults={
-                'errors_count': errors_count,
-                'is_resolved': is_resolved,
-                'try_count': try_count,
-            },
+        events = request.data.get('events')
+        if events is None:
+            events = [{
+                'riddle_id': request.data.get('riddle_id'),
+                'tries': request.data.get('try_count', 1),
+                'errors': request.data.get('errors_count', 0),
+                'solved': request.data.get('is_resolved', False),
+            }]
+
+        if not member_name:
+            return Response({"error": "Le nom du membre est requis."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RiddleStatsEventSerializer(data=events, many=True, allow_empty=False)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Valider le membre et les énigmes (index en mémoire, sans requête)
+        member_id = Member.objects.filter(user__username=member_name).values_list('pk', flat=True).first()
+        if member_id is None:
+            return Response({"error": "Membre introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        known_ids = answer_index.riddle_ids()
+        unknown_ids = sorted({event['riddle_id'] for event in serializer.validated_data} - set(known_ids))
+        if unknown_ids:
+            return Response({"error": "Énigmes introuvables.", "riddle_ids": unknown_ids}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Cumuler les évènements par énigme puis les appliquer en un seul upsert
+        solved_at = now()
+        rows = {}
+        for event in serializer.validated_data:
+            row = rows.setdefault(event['riddle_id'], {
+                'member_id': member_id,
+                'riddle_id': event['riddle_id'],
+                'try_count': 0,
+                'errors_count': 0,
+                'solve_count': 0,
+                'first_solved_at': None,
+            })
+            row['try_count'] += event['tries']
+            row['errors_count'] += event['errors']
+            if event['solved']:
+                row['solve_count'] += 1
+                row['first_solved_at'] = solved_at
+        with transaction.atomic():
+            upsert_riddle_stats(rows.values())
+
+        # Retourner les statistiques à jour (incréments encore en attente dans le tampon compris)
+        buffer = riddle_stats_buffer()
+        stats = (
+            MemberRiddleStats.objects.filter(member_id=member_id, riddle_id__in=rows)
+            .select_related('member__user', 'riddle')
+            .defer('riddle__riddle_response')
+            .order_by('riddle_id')
         )
-
-        if not created:
-            # Mettre à jour les données si elles existent déjà
-            riddle_stats.errors_count += errors_count
-            if is_resolved and not riddle_stats.is_resolved:
-                riddle_stats.is_resolved = True
-                riddle_stats.first_resolved_at = riddle_stats.first_resolved_at or now()
-            riddle_stats.resolution_count += 1 if is_resolved else 0
-            riddle_stats.save()
-
-        # Sérialiser et retourner la réponse
-        serializer = RiddleStatsSerializer(riddle_stats)
+        serializer = RiddleStatsSerializer([buffer.merge_pending(item) for item in stats], many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
 class UpdateRiddleStatsView(APIView):
     """
     Vue pour mettre à jour les statistiques d'une énigme pour un membre.
+    Les incréments passent par le tampon d'écriture différée (voir stats_buffer).
     """
 
+    ACTIONS = {
+        'mark_solved': {'solves': 1},
+        'increment_errors': {'errors': 1},
+        'increment_tries': {'tries': 1},
+    }
+
     def post(self, request):
         member_name = request.data.get('member_name')
         riddle_id = request.data.get('riddle_id')
@@ -323,23 +456,24 @@ class UpdateRiddleStatsView(APIView):
         # Validation des données
         if not member_name or not riddle_id or not action:
             return Response({"error": "Membre, énigme et action sont requis."}, status=status.HTTP_400_BAD_REQUEST)
+        if action not in self.ACTIONS:
+            return Response({"error": "Action non valide."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Récupérer le membre et l'énigme
-        member = get_object_or_404(Member, user__username=member_name)
-        riddle = get_object_or_404(Riddle, riddle_id=riddle_id)
-
-        # Récupérer ou créer les statistiques
-        riddle_stats, created = MemberRiddleStats.objects.get_or_create(member=member, riddle=riddle)
+        member_id = Member.objects.filter(user__username=member_name).values_list('pk', flat=True).first()
+        if member_id is None:
+            return Response({"error": "Membre introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        entry = answer_index.get(riddle_id)
+        if entry is None:
+            return Response({"error": "Énigme introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
         # Appliquer l'action
-        if action == 'mark_solved':
-            riddle_stats.mark_solved()
-        elif action == 'increment_errors':
-            riddle_stats.increment_errors()
-        elif action == 'increment_tries':
-            riddle_stats.increment_tries()
-        else:
-            return Response({"error": "Action non valide."}, status=status.HTTP_400_BAD_REQUEST)
+        increments = self.ACTIONS[action]
+        buffer = riddle_stats_buffer()
+        buffer.record(member_id, entry.riddle_id, solved_at=now() if 'solves' in increments else None, **increments)
+
+        riddle_stats = MemberRiddleStats.objects.filter(member_id=member_id, riddle_id=entry.riddle_id).first()
+        riddle_stats = buffer.merge_pending(riddle_stats or MemberRiddleStats(member_id=member_id, riddle_id=entry.riddle_id))
 
         # Retourner la réponse
         return Response({
@@ -362,8 +496,11 @@ class CheckRiddleStatsView(APIView):
         member = get_object_or_404(Member, user__username=member_name)
         riddle = get_object_or_404(Riddle, riddle_id=riddle_id)
 
-        # Vérifier si la statistique existe
+        # Vérifier si la statistique existe (en base ou en attente d'écriture)
         exists = MemberRiddleStats.objects.filter(member=member, riddle=riddle).exists()
+        if not exists:
+            pending = riddle_stats_buffer().pending(member.pk, riddle.pk)
+            exists = any(pending.values())
 
         return Response({"exists": exists}, status=200)
     
@@ -377,8 +514,14 @@ class GetRiddleStatsView(APIView):
         member = get_object_or_404(Member, user__username=username)
         riddle = get_object_or_404(Riddle, riddle_id=riddle_id)
 
-        # Récupérer les statistiques ou retourner une erreur si elles n'existent pas
-        stats = get_object_or_404(MemberRiddleStats, member=member, riddle=riddle)
+        # Récupérer les statistiques, complétées des incréments pas encore écrits en base
+        buffer = riddle_stats_buffer()
+        stats = MemberRiddleStats.objects.filter(member=member, riddle=riddle).first()
+        if stats is None:
+            if not any(buffer.pending(member.pk, riddle.pk).values()):
+                return Response({"error": "Statistiques introuvables."}, status=status.HTTP_404_NOT_FOUND)
+            stats = MemberRiddleStats(member=member, riddle=riddle)
+        stats = buffer.merge_pending(stats)
 
         # Sérialiser et retourner les statistiques
         serializer = RiddleStatsSerializer(stats)
@@ -413,26 +556,14 @@ class MemberDashboardView(APIView):
 
         rank_name = member.rank.rank_name if member.rank else None
 
-        achieved_riddles_count = member.achieved_riddles.count()
+        # Histogramme des thèmes maintenu à chaque résolution : pas d'agrégat sur les énigmes réussies
+        Member.fill_theme_histograms([member])
+        histogram = member.theme_histogram
+        achieved_riddles_count = sum(histogram.values())
 
         bio = user.bio
 
-        theme_counts = (
-            member.achieved_riddles
-            .values("riddle_theme")
-            .annotate(count=Count("riddle_theme"))
-        )
-        # Calcul du total
-        total_riddles = sum(item["count"] for item in theme_counts)
-        theme_distribution = {}
-        if total_riddles > 0:
-            for item in theme_counts:
-                theme = item["riddle_theme"]
-                count = item["count"]
-                percentage = round((count / total_riddles) * 100, 2)
-                theme_distribution[theme] = percentage
-        else:
-            pass
+        theme_distribution = Member.theme_distribution(histogram)
 
         data = {
             "score_solo": score_solo,
@@ -466,12 +597,8 @@ class CreateClanView(APIView):
             except Member.DoesNotExist:
                 member = Member.objects.create(user=user)
 
-            member.clan = clan
-            member.is_clan_admin = True
-            member.save()
-
-            clan.clan_members_count += 1
-            clan.save()
+            member.change_clan(clan, is_clan_admin=True)
+            clan.refresh_from_db()
 
             return Response(
                 {
@@ -501,10 +628,9 @@ class JoinClanView(APIView):
         except Clan.DoesNotExist:
             return Response({"error": "Clan not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        member.clan = clan
-        clan.clan_members_count += 1
-        member.save()
-        clan.save()
+        if member.clan_id != clan.clan_id:
+            member.change_clan(clan)
+            clan.refresh_from_db()
 
         return Response(
             {
@@ -514,44 +640,71 @@ class JoinClanView(APIView):
             status=status.HTTP_200_OK
         )
     
-class ClanListView(generics.ListAPIView):
+class ClanListView(APIView):
     """
-    Vue pour lister tous les clans.
+    Vue pour lister les clans par élo, servie depuis l'index de classement (back/leaderboard.py).
+    - ?limit=&offset= : top N (limit 50 par défaut, 100 max)
+    - ?around=<clan_name>&radius= : fenêtre autour d'un clan
+    Chaque clan est renvoyé avec son rang.
     """
-    clans = Clan.objects.all()
-    for clan in clans:
-        clan.update_elo()
-    queryset = Clan.objects.all().order_by('-clan_elo') 
-    serializer_class = ClanSerializer
     permission_classes = [IsAuthenticated]
+    default_limit = 50
+    max_limit = 100
+
+    def get(self, request):
+        leaderboard = clan_leaderboard()
+        leaderboard.ensure_loaded()
+
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            radius = min(int(request.query_params.get('radius', 5)), self.max_limit // 2)
+        except ValueError:
+            return Response({"error": "limit, offset et radius doivent être des entiers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        around = request.query_params.get('around')
+        if around:
+            clan_id = Clan.objects.filter(clan_name=around).values_list('clan_id', flat=True).first()
+            if clan_id is None:
+                return Response({"error": "Clan not found."}, status=status.HTTP_404_NOT_FOUND)
+            offset, entries = leaderboard.around(clan_id, radius)
+        else:
+            entries = leaderboard.top(limit, offset)
+
+        clans = Clan.objects.in_bulk([clan_id for clan_id, _ in entries])
+        data = []
+        for position, (clan_id, _) in enumerate(entries):
+            clan = clans.get(clan_id)
+            if clan is None:
+                continue  # Clan supprimé entre-temps
+            data.append({**ClanSerializer(clan).data, 'rank': offset + position + 1})
+        return Response(data, status=status.HTTP_200_OK)
 
 class ClanDetailView(APIView):
     def get(self, request, clan_name):
         clan = get_object_or_404(Clan, clan_name=clan_name)
-        members = Member.objects.filter(clan=clan)
-
-        # Données globales sur les énigmes par thème
-        global_theme_counts = (
-            Riddle.objects.filter(achieved_by_members__in=members)
-            .values("riddle_theme")
-            .annotate(count=Count("riddle_theme"))
+        # Une seule requête pour les membres, leur utilisateur et leur rang
+        members = list(
+            Member.objects.filter(clan=clan)
+            .select_related('user', 'rank')
+            .only(
+                'user__username', 'user__email', 'rank__rank_name',
+                'member_score', 'member_clan_score', 'is_clan_admin', 'theme_histogram',
+            )
+            .order_by('-member_score', 'user_id')
         )
 
-        # Nombre total d'énigmes réalisées par tous les membres
-        total_riddles_completed = Riddle.objects.filter(
-            achieved_by_members__in=members
-        ).count()
-
-        global_theme_distribution = {}
-        total_riddles = sum(item["count"] for item in global_theme_counts)
-        if total_riddles > 0:
-            for item in global_theme_counts:
-                theme = item["riddle_theme"]
-                count = item["count"]
-                percentage = round((count / total_riddles) * 100, 2)
-                global_theme_distribution[theme] = percentage
+        # Distribution globale : somme des histogrammes de thèmes des membres (une seule requête)
+        Member.fill_theme_histograms(members)
+        histograms = {member.pk: member.theme_histogram for member in members}
+        global_histogram = {}
+        for histogram in histograms.values():
+            for theme, count in histogram.items():
+                global_histogram[theme] = global_histogram.get(theme, 0) + count
 
-        clan.update_elo()  # Mettre à jour l'ELO du clan
+        # Nombre total d'énigmes réalisées par tous les membres
+        total_riddles_completed = sum(global_histogram.values())
+        global_theme_distribution = Member.theme_distribution(global_histogram)
 
         # Données du clan
         clan_data = {
@@ -569,22 +722,7 @@ class ClanDetailView(APIView):
         # Membres avec riddle_theme_distribution
         member_data = []
         for member in members:
-            # Calcul des thèmes des énigmes réussies
-            theme_counts = (
-                member.achieved_riddles
-                .values("riddle_theme")
-                .annotate(count=Count("riddle_theme"))
-            )
-            
-            # Calcul du total des énigmes réussies
-            total_riddles = sum(item["count"] for item in theme_counts)
-            theme_distribution = {}
-            if total_riddles > 0:
-                for item in theme_counts:
-                    theme = item["riddle_theme"]
-                    count = item["count"]
-                    percentage = round((count / total_riddles) * 100, 2)
-                    theme_distribution[theme] = percentage
+            theme_distribution = Member.theme_distribution(histograms[member.pk])
 
             # Ajouter les données du membre
             member_data.append({
@@ -605,43 +743,35 @@ class ClanDetailView(APIView):
 
         return Response(response_data, status=status.HTTP_200_OK)
     
-from django.db.models import Sum
-    
 class GlobalClanStatsView(APIView):
     """
     Retourne des statistiques globales sur les clans et les défis.
+    Servies depuis l'instantané en mémoire de back/global_stats.py (compteurs tenus à jour
+    à chaque résolution et création de clan, recalculés par la commande reconcile_global_stats).
     """
     def get(self, request):
-        total_clans = Clan.objects.count()
-        total_defis_realises = Riddle.achieved_by_members.through.objects.count()
-        total_scores = Member.objects.aggregate(score_sum=Sum("member_score"))["score_sum"] or 0
+        stats = global_stats.get()
 
         data = {
-            "total_clans": total_clans,
-            "total_defis_realises": total_defis_realises,
-            "total_scores": total_scores,
+            "total_clans": stats["total_clans"],
+            "total_defis_realises": stats["total_defis_realises"],
+            "total_scores": stats["total_scores"],
         }
         return Response(data, status=status.HTTP_200_OK)
     
 class CoopConnectedMembersView(APIView):
+    """
+    Membres actuellement connectés à la salle coop d'une énigme (registre de présence
+    alimenté par CoopConsumer), avec leur rôle.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, riddle_id):
-        try:
-            riddle = Riddle.objects.get(riddle_id=riddle_id)
-        except Riddle.DoesNotExist:
+        if answer_index.get(riddle_id) is None:
             return Response({"error": "Énigme non trouvée."}, status=status.HTTP_404_NOT_FOUND)
 
-        group_name = f"coop_{riddle.riddle_id}"
-        channel_layer = get_channel_layer()
-        connected_members = []
-
-        # Obtenir les membres connectés via le channel layer
-        invitations = CoopInvitation.objects.filter(riddle=riddle, status='accepted')
-        connected_members = [invitation.invitee for invitation in invitations]
-
-        serializer = MemberSerializer(connected_members, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        members = coop_presence().roster(f"coop_{riddle_id}")
+        return Response(members, status=status.HTTP_200_OK)
 
 class UploadCVView(APIView):
     """
@@ -671,7 +801,8 @@ class UploadCVView(APIView):
         if file.content_type != 'application/pdf' or not file.name.endswith('.pdf'):
             return Response({"error": "Seuls les fichiers PDF sont acceptés."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Gestion des fichiers existants
+        # Gestion des fichiers existants (relu en base : request.user vient du cache de l'authentification)
+        user.refresh_from_db(fields=['cv'])
         if user.cv:
             user.cv.cv_file.delete()  # Supprimer l'ancien fichier
             user.cv.delete()
@@ -679,7 +810,7 @@ class UploadCVView(APIView):
         # Créer et associer le nouveau CV
         cv = CV.objects.create(cv_file=file)
         user.cv = cv
-        user.save()
+        user.save(update_fields=['cv'])
 
         return Response({"message": "CV uploadé avec succès !", "cv_id": cv.cv_id}, status=status.HTTP_201_CREATED)
     
@@ -699,6 +830,10 @@ class GetCVView(RetrieveAPIView):
 # Gameplay views
 
 class IsRiddleSolved(APIView):
+    """
+    Vérifie la réponse d'une énigme solo via le registre de vérificateurs (back/checkers.py) :
+    comparaison d'empreintes en mémoire, sans relire la ligne Riddle.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -709,61 +844,23 @@ class IsRiddleSolved(APIView):
         riddle_id = data.get('riddle_id')
         user_response = data.get('response')
 
+        entry, checker, is_correct = verify_answer(member, riddle_id, user_response)
+
         # If riddle_id doesn't exist
-        try:
-            riddle = Riddle.objects.get(riddle_id=riddle_id)
-        except Riddle.DoesNotExist:
+        if entry is None:
             return Response({'error': 'Riddle not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-
-        if riddle_id == 8:
-            try:
-                # Generate a random number between 0 and 9999
-                random_number = random.randint(0, 9999)
-                random_number_str = str(random_number)  # Convert to string for comparison
-                user_response = data.get("response", {}).get("value", {})
-                logger.debug(f"Generated random number: {random_number_str}")
-                logger.debug(f"User response values: {user_response}")
-                
-                # Check if the random number is in user_response values
-                if random_number_str in user_response.values():
-                    logger.info(f"Riddle 8 solved successfully by user {user.username}")
-                    member.add_riddle_to_achieved(riddle)
-                    member.clan.update_elo()
-                    return Response({
-                        "is_solved": True,
-                        "message": "Correct answer!",
-                    }, status=status.HTTP_200_OK)
-                else:
-                    logger.warning(f"Incorrect answer for riddle 8 by user {user.username}")
-                    return Response({
-                        "is_solved": False,
-                        "message": "Incorrect answer.",
-                    }, status=status.HTTP_200_OK)
-
-            except Exception as e:
-                logger.error(f"Error processing riddle 8: {str(e)}", exc_info=True)
-                return Response({
-                    "error": "An error occurred while processing riddle 8",
-                    "details": str(e)
-                }, status=status.HTTP_400_BAD_REQUEST)
 
         # If user already solved the riddle
-        member_achieved_riddles = member.achieved_riddles.all()
-        if riddle in member_achieved_riddles:
-            if riddle_id == 9: # Get Calculatrice
-                member.have_calculatrice = True
-                member.save()
+        if member.achieved_riddles.filter(riddle_id=entry.riddle_id).exists():
+            checker.on_already_solved(entry, member)
             return Response({'is_solved': True, 'message': 'Riddle already solved'}, status=status.HTTP_200_OK)
 
         # Check if the response is correct
-        if user_response == riddle.riddle_response:
-            # Add the riddle to the user's solved riddles
-            member.add_riddle_to_achieved(riddle)
-            if riddle_id == 9: # Get Calculatrice
-                member.have_calculatrice = True
-                member.save()
-                member.clan.update_elo()
+        if is_correct:
+            # Add the riddle to the user's solved riddles (score, rank and clan elo in one transaction)
+            solve_riddle(member, entry.as_riddle())
+            checker.on_solved(entry, member)
+            logger.info(f"Riddle {entry.riddle_id} solved successfully by user {user.username}")
             return Response({'is_solved': True, 'message': 'Correct answer!'}, status=status.HTTP_200_OK)
 
         # If the response is incorrect
@@ -771,7 +868,6 @@ class IsRiddleSolved(APIView):
     
 from django.http import JsonResponse
 from rest_framework.exceptions import ValidationError
-import random
 import logging
 logger = logging.getLogger('custom_logger')
 
@@ -786,35 +882,23 @@ class IsCoopRiddleSolved(APIView):
         riddle_id = data.get('riddle_id')
         user_response = data.get('response')  # Expected as a JSON object
 
+        entry, checker, is_correct = verify_answer(member, riddle_id, user_response)
+
         # If riddle_id doesn't exist
-        try:
-            riddle = Riddle.objects.get(riddle_id=riddle_id)
-        except Riddle.DoesNotExist:
+        if entry is None:
             return Response({'error': 'Riddle not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # If user already solved the riddle
-        member_achieved_riddles = member.achieved_coop_riddles.all()
-        if riddle in member_achieved_riddles:
+        if member.achieved_coop_riddles.filter(riddle_id=entry.riddle_id).exists():
             return Response({'is_solved': True, 'message': 'Riddle already solved'}, status=status.HTTP_200_OK)
-        
-
-        # Check if the response is correct
-        try:
-            # Parse expected riddle response from JSONField
-            expected_response = riddle.riddle_response
-            expected_value = expected_response.get('value', {})
-            user_value = user_response.get('value', {})
-            # Compare user_response and expected_response
-            if user_value == expected_value:
-                # Add the riddle to the user's solved riddles
-                member.add__coop_riddle_to_achieved_coop(riddle)
-                return Response({'is_solved': True, 'message': 'Correct answer!'}, status=status.HTTP_200_OK)
-            else:
-                return Response({'is_solved': False, 'message': 'Incorrect answer...'}, status=status.HTTP_200_OK)
 
-        except ValueError as e:
-            # Handle invalid JSON or incorrect format
-            return Response({'error': 'Invalid response format.', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Check if the response is correct (the coop checker compares the 'value' sub-objects)
+        if is_correct:
+            # Add the riddle to the user's solved riddles
+            solve_coop_riddle(member, entry.as_riddle())
+            checker.on_solved(entry, member)
+            return Response({'is_solved': True, 'message': 'Correct answer!'}, status=status.HTTP_200_OK)
+        return Response({'is_solved': False, 'message': 'Incorrect answer...'}, status=status.HTTP_200_OK)
 
     
 class GetClue(APIView):
@@ -883,29 +967,26 @@ class InviteMemberToCoopView(APIView):
         if CoopInvitation.objects.filter(riddle=riddle, invitee=invitee_member, status='pending').exists():
             return Response({"error": "Une invitation est déjà en attente pour cet utilisateur."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Créer l'invitation
-        invitation = CoopInvitation.objects.create(
-            riddle=riddle,
-            inviter=inviter_member,
-            invitee=invitee_member
-        )
+        # Créer l'invitation et la notification (boîte de réception + envoi temps réel après commit)
+        with transaction.atomic():
+            invitation = CoopInvitation.objects.create(
+                riddle=riddle,
+                inviter=inviter_member,
+                invitee=invitee_member
+            )
+            notify(
+                invitee_member.pk,
+                'coop_invitation',
+                f"{inviter_member.user.username} vous a invité à rejoindre la coopérative pour l'énigme '{riddle.riddle_type}'.",
+                {
+                    'invitation_id': invitation.id,
+                    'riddle_id': riddle.riddle_id,
+                    'riddle_type': riddle.riddle_type,
+                },
+            )
 
         serializer = CoopInvitationSerializer(invitation)
 
-        # Envoyer une notification via WebSocket
-        channel_layer = get_channel_layer()
-        group_name = f"user_{invitee_user.id}"
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'coop_invitation',
-                'message': f"{inviter_member.user.username} vous a invité à rejoindre la coopérative pour l'énigme '{riddle.riddle_type}'.",
-                'invitation_id': invitation.id,
-                'riddle_id': riddle.riddle_id,
-                'riddle_type': riddle.riddle_type,
-            }
-        )
-
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
 class RespondCoopInvitationView(APIView):
@@ -924,28 +1005,19 @@ class RespondCoopInvitationView(APIView):
             return Response({"error": "Réponse invalide."}, status=status.HTTP_400_BAD_REQUEST)
 
         if response == 'accept':
-            # Ajouter le membre au groupe coopératif via WebSocket
-            channel_layer = get_channel_layer()
-            group_name = f"coop_{invitation.riddle.riddle_id}"
-            async_to_sync(channel_layer.group_add)(
-                group_name,
-                f"user_{member.user.id}"
-            )
-
-            # Mettre à jour l'état de l'invitation
-            invitation.status = 'accepted'
-            invitation.save()
+            group_name = f"coop_{invitation.riddle_id}"
+            with transaction.atomic():
+                invitation.status = 'accepted'
+                invitation.save(update_fields=['status'])
 
-            # Notifier le groupe coopératif que le membre a rejoint
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
+                # Notifier la salle coop après le commit ; le membre la rejoint en ouvrant sa socket
+                publish(group_name, {
                     'type': 'member_joined',
                     'message': f"{member.user.username} a rejoint la coopérative.",
                     'member_id': member.user.id,
                     'username': member.user.username,
-                }
-            )
+                    'members': coop_presence().roster(group_name),
+                })
 
             return Response({"message": "Invitation acceptée. Vous avez rejoint la coopérative."}, status=status.HTTP_200_OK)
 
@@ -959,9 +1031,42 @@ class FetchReceivedInvitationsView(APIView):
 
     def get(self, request):
         member = request.user.member  # Assurez-vous que chaque utilisateur a une relation OneToOne avec Member
-        pending_invitations = CoopInvitation.objects.filter(invitee=member, status='pending')
+        pending_invitations = (
+            CoopInvitation.objects.filter(invitee=member, status='pending')
+            .select_related('inviter__user', 'invitee__user', 'riddle')
+            .defer('riddle__riddle_response')
+        )
         serializer = CoopInvitationSerializer(pending_invitations, many=True)
+        # Les invitations consultées ne sont plus à notifier
+        mark_read(member.pk, kind='coop_invitation')
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class NotificationListView(APIView):
+    """
+    Boîte de réception du membre connecté (50 dernières notifications).
+    - ?unread=1 : uniquement les notifications non lues
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        notifications = Notification.objects.filter(recipient_id=request.user.pk)
+        if request.query_params.get('unread'):
+            notifications = notifications.filter(read_at__isnull=True)
+        serializer = NotificationSerializer(notifications[:INBOX_DELIVERY_LIMIT], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class MarkNotificationsReadView(APIView):
+    """Marque comme lues les notifications {"ids": [...]} du membre connecté (toutes si ids est absent)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ids = request.data.get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(id_, int) for id_ in ids)):
+            return Response({'error': 'ids doit être une liste d\'entiers.'}, status=status.HTTP_400_BAD_REQUEST)
+        count = mark_read(request.user.pk, ids)
+        return Response({'marked_read': count}, status=status.HTTP_200_OK)
     
 class UpdateBioView(APIView):
     """
@@ -977,5 +1082,5 @@ class UpdateBioView(APIView):
             return Response({"error": "La biographie est obligatoire."}, status=status.HTTP_400_BAD_REQUEST)
 
         user.bio = bio
-        user.save()
+        user.save(update_fields=['bio'])
         return Response({"message": "Biographie mise à jour avec succès !"}, status=status.HTTP_200_OK)
\ No newline at end of file
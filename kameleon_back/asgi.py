@@ -14,16 +14,11 @@ django.setup()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
-from django.urls import path
-from back.consumers import ChatConsumer, NotificationConsumer, CoopConsumer
+from kameleon_back.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
-        URLRouter([
-            path("ws/chat/", ChatConsumer.as_asgi()),
-            path("ws/notifications/", NotificationConsumer.as_asgi()),
-            path("ws/coop/<int:riddle_id>/", CoopConsumer.as_asgi()),
-        ])
+        URLRouter(websocket_urlpatterns)
     ),
 })
@@ -1,6 +1,10 @@
 from django.urls import path
-from back.consumers import RiddleConsumer
+from back.consumers import ChatConsumer, NotificationConsumer, CoopConsumer
 
 websocket_urlpatterns = [
-    
+    path("ws/chat/", ChatConsumer.as_asgi()),
+    path("ws/chat/clan/", ChatConsumer.as_asgi(room_kind="clan")),
+    path("ws/chat/coop/<int:riddle_id>/", ChatConsumer.as_asgi(room_kind="coop")),
+    path("ws/notifications/", NotificationConsumer.as_asgi()),
+    path("ws/coop/<int:riddle_id>/", CoopConsumer.as_asgi()),
 ]
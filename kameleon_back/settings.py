@@ -35,7 +35,10 @@ DEBUG = True
 ALLOWED_HOSTS = ['kameleonback.jrcan.dev', 'kameleon.jrcan.dev', 'localhost', '127.0.0.1']
 
 # SMTP / EMAIL Settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Les e-mails passent par l'outbox (back.models.OutboundEmail) et sont envoyés par la commande send_outbox_emails.
+# En test / développement : EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend ou .filebased.EmailBackend
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = env('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -70,7 +73,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'back.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise compatible avec les vues asynchrones
 ]
 
 CSRF_TRUSTED_ORIGINS = [
@@ -113,7 +116,7 @@ CORS_ALLOW_METHODS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'back.authentication.CachedJWTAuthentication',  # JWTAuthentication + utilisateur/membre/rang/clan en cache
     ),
 }
 
@@ -161,6 +164,8 @@ DATABASES = {
     }
 }
 
+REDIS_URL = env('REDIS_URL', default='redis://redis:6379')
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -168,6 +173,79 @@ CHANNEL_LAYERS = {
             "hosts": [("redis", 6379)],
         },
     },
+    # Couche dédiée au chat : les groupes (un par salon) sont répartis par hachage sur
+    # les instances Redis de CHAT_REDIS_URLS ; en ajouter augmente le débit de diffusion.
+    "chat": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": env.list('CHAT_REDIS_URLS', default=[REDIS_URL]),
+        },
+    },
+}
+
+# Chat : historique des derniers messages par salon ('redis' ou 'memory'),
+# limite de débit par connexion (capacité, messages par seconde) et taille maximale d'un message
+CHAT = {
+    'BACKEND': env('CHAT_HISTORY_BACKEND', default='redis'),
+    'URL': REDIS_URL,
+    'KEY_PREFIX': 'kameleon:chat',
+    'HISTORY_SIZE': 50,
+    'RATE': (5, 1.0),
+    'MAX_LENGTH': 1000,
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"{REDIS_URL}/1",
+        "KEY_PREFIX": "kameleon",
+    },
+}
+
+# Stockage de l'état des membres (énigmes réussies/verrouillées, indices) :
+# 'm2m' (tables de liaison) ou 'bitset' (bitmaps compacts sur Member, voir back/bitsets.py)
+MEMBER_STATE_STORAGE = env('MEMBER_STATE_STORAGE', default='m2m')
+
+# Connexion (back/login.py) : seaux à jetons (capacité, jetons par seconde) par IP et par nom d'utilisateur,
+# vérifiés avant tout calcul de hash ; les hashs sont calculés dans un pool de HASH_WORKERS threads.
+# TRUSTED_PROXIES : nombre de proxys devant l'application (traefik), dont on lit X-Forwarded-For ; 0 pour REMOTE_ADDR
+LOGIN = {
+    'IP_RATE': (20, 20 / 60),
+    'USERNAME_RATE': (5, 5 / 300),
+    'HASH_WORKERS': 4,
+    'HASH_TIMEOUT': 10,
+    'TRUSTED_PROXIES': env.int('LOGIN_TRUSTED_PROXIES', default=1),
+}
+
+# Tampon d'écriture différée des statistiques d'énigmes ('redis', 'memory' ou 'none' pour écrire directement),
+# vidé par le worker flush_riddle_stats (docker-compose) ; le backend 'memory' est vidé par les requêtes toutes les FLUSH_INTERVAL secondes
+RIDDLE_STATS_BUFFER = {
+    'BACKEND': env('RIDDLE_STATS_BUFFER_BACKEND', default='redis'),
+    'URL': REDIS_URL,
+    'KEY_PREFIX': 'kameleon:riddle_stats',
+    'FLUSH_INTERVAL': 5,
+}
+
+# Salles coop ('redis' ou 'memory') : registre de présence et état des parties
+COOP_PRESENCE = {
+    'BACKEND': env('COOP_PRESENCE_BACKEND', default='redis'),
+    'URL': REDIS_URL,
+    'KEY_PREFIX': 'kameleon:coop_presence',
+    'GAME_KEY_PREFIX': 'kameleon:coop_game',
+}
+
+# Évènements temps réel publiés par les vues HTTP : 'background' (envoi par lots depuis un thread dédié) ou 'local' (en mémoire, pour les tests)
+REALTIME_EVENTS = {
+    'BACKEND': env('REALTIME_EVENTS_BACKEND', default='background'),
+    'BATCH_SIZE': 100,
+    'MAX_QUEUE_SIZE': 10000,
+}
+
+# Classement des clans : 'redis' en production, 'memory' pour les tests
+LEADERBOARD = {
+    'BACKEND': env('LEADERBOARD_BACKEND', default='redis'),
+    'URL': REDIS_URL,
+    'KEY_PREFIX': 'kameleon:leaderboard',
 }
 
 LOGGING = {